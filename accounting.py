@@ -0,0 +1,172 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+import woocommerce_logic
+
+# Base de datos local de consumo y cada cuántos segundos se vuelcan los contadores
+ACCOUNTING_DB_PATH = os.getenv("ACCOUNTING_DB_PATH", "usage.db")
+ACCOUNTING_FLUSH_INTERVAL = int(os.getenv("ACCOUNTING_FLUSH_INTERVAL", 30))
+
+COUNTERS = (
+    "turns",
+    "openai_calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "openai_latency",
+    "woo_calls",
+    "woo_errors",
+    "woo_latency",
+)
+
+# (tenant, ruta) de la petición en curso; las tareas de fondo se registran como "_system"
+_scope = ContextVar("accounting_scope", default=None)
+
+_pending = {}
+_pending_lock = threading.Lock()
+_db_lock = threading.Lock()
+_db = None
+_flusher = None
+
+
+def _connection():
+    global _db
+    if _db is None:
+        _db = sqlite3.connect(ACCOUNTING_DB_PATH, check_same_thread=False)
+        columns = ", ".join(
+            f"{counter} {'REAL' if counter.endswith('latency') else 'INTEGER'} NOT NULL DEFAULT 0" for counter in COUNTERS
+        )
+        # Un registro por tenant y ruta en cada volcado
+        _db.execute(f"CREATE TABLE IF NOT EXISTS usage_batches (flushed_at REAL, day TEXT, tenant TEXT, route TEXT, {columns})")
+        # Acumulado diario por tenant y ruta
+        _db.execute(
+            f"CREATE TABLE IF NOT EXISTS usage_daily (day TEXT, tenant TEXT, route TEXT, {columns}, "
+            "PRIMARY KEY (day, tenant, route))"
+        )
+    return _db
+
+
+def set_scope(tenant, route):
+    _scope.set((tenant, route))
+
+
+def _add(values, scope=None):
+    tenant, route = scope or _scope.get() or ("_system", "background")
+    day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    with _pending_lock:
+        counters = _pending.setdefault((day, tenant, route), dict.fromkeys(COUNTERS, 0))
+        for counter, value in values.items():
+            counters[counter] += value
+
+
+def record_turn():
+    _add({"turns": 1})
+
+
+# Registrar una llamada a OpenAI con sus tokens (incluidos los servidos desde caché);
+# scope (tenant, ruta) la asigna fuera de la petición en curso
+def record_openai(usage, latency, scope=None):
+    details = getattr(usage, "prompt_tokens_details", None)
+    _add({
+        "openai_calls": 1,
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "openai_latency": latency,
+    }, scope)
+
+
+def _record_woo_call(store_url, method, endpoint, latency, status_code):
+    _add({
+        "woo_calls": 1,
+        "woo_errors": int(status_code is None or status_code >= 400),
+        "woo_latency": latency,
+    })
+
+
+woocommerce_logic.request_hooks.append(_record_woo_call)
+
+
+# Volcar los contadores acumulados a SQLite en una sola transacción
+def flush():
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+
+    now = time.time()
+    rows = [(now, day, tenant, route, *(counters[counter] for counter in COUNTERS)) for (day, tenant, route), counters in pending.items()]
+    placeholders = ", ".join("?" for _ in range(4 + len(COUNTERS)))
+    daily_placeholders = ", ".join("?" for _ in range(3 + len(COUNTERS)))
+    updates = ", ".join(f"{counter} = {counter} + excluded.{counter}" for counter in COUNTERS)
+    try:
+        with _db_lock:
+            db = _connection()
+            with db:
+                db.executemany(f"INSERT INTO usage_batches VALUES ({placeholders})", rows)
+                db.executemany(
+                    f"INSERT INTO usage_daily VALUES ({daily_placeholders}) "
+                    f"ON CONFLICT (day, tenant, route) DO UPDATE SET {updates}",
+                    [row[1:] for row in rows],
+                )
+    except Exception as e:
+        logging.error(f"Error guardando el consumo: {e}")
+        # Devolver los contadores para reintentarlo en el siguiente volcado
+        with _pending_lock:
+            for key, counters in pending.items():
+                current = _pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                for counter, value in counters.items():
+                    current[counter] += value
+        return 0
+    return len(rows)
+
+
+# Consumo diario por tenant y ruta, con filtros opcionales (días en formato AAAA-MM-DD)
+def query_usage(tenant=None, route=None, start_day=None, end_day=None):
+    flush()
+    conditions, params = [], []
+    for column, operator, value in (
+        ("tenant", "=", tenant),
+        ("route", "=", route),
+        ("day", ">=", start_day),
+        ("day", "<=", end_day),
+    ):
+        if value:
+            conditions.append(f"{column} {operator} ?")
+            params.append(value)
+    query = f"SELECT day, tenant, route, {', '.join(COUNTERS)} FROM usage_daily"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY day, tenant, route"
+
+    with _db_lock:
+        rows = _connection().execute(query, params).fetchall()
+    results = []
+    for row in rows:
+        entry = dict(zip(("day", "tenant", "route", *COUNTERS), row))
+        entry["openai_latency_avg"] = round(entry["openai_latency"] / entry["openai_calls"], 3) if entry["openai_calls"] else 0
+        entry["woo_latency_avg"] = round(entry["woo_latency"] / entry["woo_calls"], 3) if entry["woo_calls"] else 0
+        results.append(entry)
+    return results
+
+
+def _flush_loop():
+    while True:
+        time.sleep(ACCOUNTING_FLUSH_INTERVAL)
+        flush()
+
+
+# Iniciar el volcado periódico (y uno final al apagar el proceso)
+def start():
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_loop, daemon=True)
+        _flusher.start()
+        atexit.register(flush)
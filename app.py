@@ -1,20 +1,45 @@
-from flask import Flask, request, jsonify, abort, make_response, Response
+from flask import Flask, request, jsonify, abort, make_response, Response, g
 import openai
 import logging
 from logging.handlers import RotatingFileHandler
 import os
 import re
+import sys
 import json
-import threading  # Importar gevent para manejar el pedido en segundo plano
+import time
+import hmac
+import hashlib
+import base64
 
 # Importar las funciones de woocommerce_logic.py
-from woocommerce_logic import create_order, get_order, search_products
-from woocommerce import API
+import woocommerce_logic
+from woocommerce_logic import OrderRejected, create_order, find_order_by_meta, get_order, search_products, get_variations_many
+import warmup
+import coalescing
+import routing
+import catalog_feed
+import shadow
+import profiling
+import accounting
+import serialization
+import memory
+import lifecycle
+import cassettes
+import locale_format
+from history import History, load_history, sessions
+
+# Grabar o reproducir las llamadas a OpenAI y WooCommerce si CASSETTE_MODE lo indica
+cassettes.install(modules=(sys.modules[__name__],))
+
 # Cargar variables de entorno
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # Definir tu clave API para autenticación
 API_KEY = os.getenv("FLASK_SECRET_API_KEY")
+# Clave de los endpoints de administración sensibles (sin ella quedan deshabilitados)
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+# Variaciones listadas por producto en los resultados de búsqueda (límite de tamaño de WhatsApp)
+MAX_VARIATIONS_SHOWN = int(os.getenv("MAX_VARIATIONS_SHOWN", 10))
 
 # Configuración de la aplicación Flask
 app = Flask(__name__)
@@ -33,21 +58,120 @@ def check_api_key():
     api_key = request.headers.get("X-API-Key")
     return api_key == API_KEY
 
-# Función para manejar la creación de pedidos en un hilo separado
-def process_order_async(store_credentials, parameters):
+# Función para verificar la clave de administración
+def check_admin_key():
+    admin_key = request.headers.get("X-Admin-Key")
+    return bool(ADMIN_API_KEY) and admin_key == ADMIN_API_KEY
+
+# Perfilado opcional de la petición (activado desde /llm-integration/admin/profiling)
+@app.before_request
+def start_profiling():
+    g.profile = profiling.start_request(request.path)
+
+@app.teardown_request
+def finish_profiling(exc):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        try:
+            files = profiling.finish_request(profile)
+            app.logger.info(f"Perfil de {profile['path']} escrito en {files}")
+        except Exception as e:
+            app.logger.error(f"Error writing profile: {str(e)}")
+
+# Durante el apagado se rechazan las peticiones nuevas y se cuentan las que siguen en curso.
+# Los webhooks de WooCommerce se siguen atendiendo: son rápidos y WooCommerce desactiva
+# el webhook tras varios fallos de entrega.
+@app.before_request
+def track_request():
+    if lifecycle.state["draining"] and request.method == "POST" and not request.path.startswith("/woocommerce/"):
+        response = jsonify({"error": "Service shutting down"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(lifecycle.DRAIN_RETRY_AFTER)
+        return response
+    lifecycle.request_started()
+    g.lifecycle_tracked = True
+
+@app.teardown_request
+def untrack_request(exc):
+    if g.pop("lifecycle_tracked", False):
+        lifecycle.request_finished()
+
+# Contrapresión: rechazar webhooks con 503 si la memoria estimada en uso supera el presupuesto
+@app.before_request
+def admit_request():
+    if request.method != "POST" or not request.path.startswith("/llm-integration"):
+        return None
+    reserved = memory.admit(request.content_length)
+    if reserved is None:
+        app.logger.error(f"Petición a {request.path} rechazada por presupuesto de memoria")
+        response = jsonify({"error": "Service temporarily overloaded"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(memory.RETRY_AFTER)
+        return response
+    g.memory_reserved = reserved
+
+@app.teardown_request
+def release_request(exc):
+    reserved = g.pop("memory_reserved", None)
+    if reserved is not None:
+        memory.release(reserved)
+
+# Serializar la respuesta JSON con el backend rápido (orjson cuando está disponible)
+def json_response(payload, status=200):
+    return Response(serialization.dumps_response(payload), status=status, mimetype="application/json")
+
+# Credenciales de la tienda a partir de su URL (los pedidos pendientes no guardan secretos en disco)
+def store_credentials_for(store_url):
+    for tenant in TENANTS.values():
+        if tenant["store_credentials"]['store_url'] == store_url:
+            return tenant["store_credentials"]
+    return None
+
+# Función para manejar la creación de pedidos en segundo plano (job registrado en lifecycle)
+# Devuelve True si el pedido quedó creado, lifecycle.REJECTED si no puede crearse nunca
+# y False si hay que reintentarlo
+def process_order(job):
+    store_credentials = store_credentials_for(job['store_url'])
+    if store_credentials is None:
+        app.logger.error(f"Pedido {job['job_id']} descartado: tienda desconocida {job['store_url']}")
+        return lifecycle.REJECTED
     try:
-        create_order(
+        # Un pedido reintentado pudo crearse antes del apagado sin que se borrara de pendientes
+        if job.get('replayed'):
+            existing = find_order_by_meta(
+                store_url=store_credentials['store_url'],
+                consumer_key=store_credentials['consumer_key'],
+                consumer_secret=store_credentials['consumer_secret'],
+                key="_llm_order_job",
+                value=job['job_id'],
+                after=job['accepted_at']
+            )
+            if existing is not None:
+                app.logger.info(f"Pedido {job['job_id']} ya creado en la tienda con ID {existing.get('id')}")
+                return True
+        # Identificar el pedido en WooCommerce por si se reintenta tras un apagado abrupto
+        parameters = dict(job['order_data'])
+        parameters['meta_data'] = list(parameters.get('meta_data') or []) + [{"key": "_llm_order_job", "value": job['job_id']}]
+        order = create_order(
             store_url=store_credentials['store_url'],
             consumer_key=store_credentials['consumer_key'],
             consumer_secret=store_credentials['consumer_secret'],
             order_data=parameters
         )
+    except OrderRejected as e:
+        app.logger.error(f"La tienda rechazó el pedido {job['job_id']}: {str(e)}")
+        return lifecycle.REJECTED
     except Exception as e:
         app.logger.error(f"Error en la creación del pedido: {str(e)}")
+        return False
+    return isinstance(order, dict) and bool(order.get('id'))
+
 
+# Respuestas de handle_action que indican que la acción no se pudo ejecutar
+ACTION_FAILURE_RESPONSES = {"Hubo un error procesando tu solicitud.", "Acción no reconocida."}
 
-# Función para manejar acciones de WooCommerce
-def handle_action(response_text, store_credentials):
+# Función para manejar acciones de WooCommerce; formatter da el formato de precios y estados de la tienda
+def handle_action(response_text, store_credentials, formatter):
     # Extraer el comando de acción
     pattern = r"\[ACTION\]\((\w+)\)\s*(\{.*\})"
     match = re.search(pattern, response_text, re.DOTALL)
@@ -66,9 +190,9 @@ def handle_action(response_text, store_credentials):
             # Crear el mensaje de respuesta inmediato para Dialogflow
             response_message = "Acabo de enviar tu pedido a la trasportadora para que sea procesado. Te llegara un WhatsApp que debes confirmar, para que despachen tu pedido."
 
-            # Iniciar el hilo como daemon para que no bloquee la ejecución principal
-            thread = threading.Thread(target=process_order_async, args=(store_credentials, parameters), daemon=True)
-            thread.start()
+            # Guardar el pedido en disco y crearlo en segundo plano; si el proceso se detiene
+            # antes de terminar, se reintenta al arrancar
+            lifecycle.submit_order({"store_url": store_credentials['store_url'], "order_data": parameters}, process_order)
 
             app.logger.info("Respuesta enviada a Dialogflow, procesando pedido en segundo plano.")
             return response_message  # Retorna solo el mensaje de texto
@@ -91,18 +215,10 @@ def handle_action(response_text, store_credentials):
             
             # Generar la respuesta en función del resultado de get_order
             if order_info:
-                # Diccionario para traducir el estado del pedido
-                estado_traducciones = {
-                    "on-hold": "En espera de confirmación",
-                    "processing": "Pedido enviado a la transportadora",
-                    "completed": "Pedido entregado",
-                    "cancelled": "Pedido cancelado",
-                    "refunded": "Pedido reembolsado"
-                }
-                
-                status = order_info.get('status')
-                estado_traducido = estado_traducciones.get(status, status)  # Usa la traducción si existe, si no deja el original
-                total = order_info.get('total')
+                # Estado traducido y total con el formato de la tienda
+                estado_traducido = formatter.order_status(order_info.get('status'))
+                currency = order_info.get('currency')
+                total = formatter.price(order_info.get('total'), currency)
                 order_id_result = order_info.get('id')
                 billing = order_info.get('billing', {})
                 shipping = order_info.get('shipping', {})
@@ -118,7 +234,7 @@ def handle_action(response_text, store_credentials):
                     f"📍 **Dirección de envío**: {shipping.get('address_1', 'N/A')}, {shipping.get('city', 'N/A')}, {shipping.get('state', 'N/A')}\n\n"
                     f"🛒 **Artículos del pedido**:\n"
                     + "".join(
-                        f"   - {item.get('name', 'Producto sin nombre')}: {item.get('quantity', 1)} x {item.get('total', 'N/A')}\n"
+                        f"   - {formatter.line_item(item, currency)}\n"
                         for item in order_info.get('line_items', [])
                     ) +
                     "\nGracias por tu compra. ¡Esperamos que disfrutes de nuestros productos! 😄"
@@ -141,58 +257,64 @@ def handle_action(response_text, store_credentials):
             )
 
             if products:
-                # Limitar la búsqueda a un solo producto
-                product = products[0]
-                product_id = product.get('id', 'N/A')
-                product_name = product.get('name', 'Nombre no disponible')
-                price = product.get('price', 'N/A')
-                currency = product.get('currency', 'N/A')
-                permalink = product.get('permalink', '#')
-
-                response_message = "🔍 **Resultado de la búsqueda:**\n\n"
-                response_message += f"**{product_name} (ID: {product_id})**\n"
-                response_message += f"💲 Precio: {price} {currency}\n"
-                response_message += f"🔗 [Ver Producto]({permalink})\n\n"
-
-                # Verificar si el producto es variable
-                if product.get('type') == 'variable':
-                    try:
-                        # Instanciar la API de WooCommerce
-                        wcapi = API(
-                            url=store_credentials['store_url'],
-                            consumer_key=store_credentials['consumer_key'],
-                            consumer_secret=store_credentials['consumer_secret'],
-                            version="wc/v3"
-                        )
-                        app.logger.info(f"Obteniendo variaciones para el producto ID: {product_id}")
-                        variations_response = wcapi.get(f"products/{product_id}/variations", params={"per_page": 100})
-                        variations_response.raise_for_status()
-                        variations = variations_response.json()
-                        app.logger.info(f"Variaciones encontradas: {len(variations)}")
-
-                        if variations:
-                            # Extraer nombres de atributos de la primera variación
-                            first_variation = variations[0]
-                            attributes = first_variation.get('attributes', [])
-                            attribute_names = [attr.get('name', 'Atributo') for attr in attributes]
-                            attributes_header = ' y '.join(attribute_names) if attribute_names else 'Atributos'
-
-                            response_message += "🔄 **Variaciones Disponibles:**\n"
-                            response_message += f"{attributes_header}\n"
-
-                            for variation in variations:
-                                variation_id = variation.get('id', 'N/A')
-                                attributes = variation.get('attributes', [])
-                                # Extraer solo los valores de los atributos, manteniendo el orden
-                                attribute_values = [attribute.get('option', 'N/A') for attribute in attributes]
-                                # Unir los valores con dos espacios para mayor claridad
-                                attribute_values_formatted = '  '.join(attribute_values)
-                                response_message += f"- ID: {variation_id} | {attribute_values_formatted}\n"
-                            response_message += "\n"
-                    except Exception as e:
-                        app.logger.error(f"Error obteniendo variaciones para el producto {product_id}: {e}")
+                # Variaciones de los productos variables mostrados, consultadas en paralelo
+                variable_ids = [product.get('id') for product in products if product.get('type') == 'variable']
+                variations_by_product = {}
+                if variable_ids:
+                    app.logger.info(f"Obteniendo variaciones para los productos ID: {variable_ids}")
+                    variations_by_product = get_variations_many(
+                        store_url=store_credentials['store_url'],
+                        consumer_key=store_credentials['consumer_key'],
+                        consumer_secret=store_credentials['consumer_secret'],
+                        product_ids=variable_ids
+                    )
+
+                if len(products) == 1:
+                    response_message = "🔍 **Resultado de la búsqueda:**\n\n"
+                else:
+                    response_message = "🔍 **Resultados de la búsqueda:**\n\n"
+
+                for product in products:
+                    product_id = product.get('id', 'N/A')
+                    product_name = product.get('name', 'Nombre no disponible')
+                    price = formatter.price(product.get('price'))
+                    permalink = product.get('permalink', '#')
+
+                    response_message += f"**{product_name} (ID: {product_id})**\n"
+                    response_message += f"💲 Precio: {price}\n"
+                    if product.get('stock_status') == 'outofstock':
+                        response_message += "⚠️ Agotado por el momento\n"
+                    response_message += f"🔗 [Ver Producto]({permalink})\n\n"
+
+                    # Verificar si el producto es variable
+                    if product.get('type') != 'variable':
+                        continue
+                    variations = variations_by_product.get(product_id)
+                    if variations is None:
                         # Opcional: Puedes informar al usuario que hubo un error al obtener variaciones
                         response_message += "🔄 **Variaciones Disponibles:** No se pudieron obtener las variaciones en este momento.\n\n"
+                    elif variations:
+                        app.logger.info(f"Variaciones encontradas para {product_id}: {len(variations)}")
+                        # Extraer nombres de atributos de la primera variación
+                        first_variation = variations[0]
+                        attributes = first_variation.get('attributes', [])
+                        attribute_names = [attr.get('name', 'Atributo') for attr in attributes]
+                        attributes_header = ' y '.join(attribute_names) if attribute_names else 'Atributos'
+
+                        response_message += "🔄 **Variaciones Disponibles:**\n"
+                        response_message += f"{attributes_header}\n"
+
+                        for variation in variations[:MAX_VARIATIONS_SHOWN]:
+                            variation_id = variation.get('id', 'N/A')
+                            attributes = variation.get('attributes', [])
+                            # Extraer solo los valores de los atributos, manteniendo el orden
+                            attribute_values = [attribute.get('option', 'N/A') for attribute in attributes]
+                            # Unir los valores con dos espacios para mayor claridad
+                            attribute_values_formatted = '  '.join(attribute_values)
+                            response_message += f"- ID: {variation_id} | {attribute_values_formatted}\n"
+                        if len(variations) > MAX_VARIATIONS_SHOWN:
+                            response_message += f"... y {len(variations) - MAX_VARIATIONS_SHOWN} variaciones más en el enlace del producto\n"
+                        response_message += "\n"
 
                 # Modificar el mensaje final según lo solicitado
                 response_message += "Puedes realizar tu pedido en el enlace o yo puedo ayudarte por este medio.\n"
@@ -207,7 +329,7 @@ def handle_action(response_text, store_credentials):
         return response_text
 
 # Función común para manejar las solicitudes
-def handle_request(prompt, store_credentials=None):
+def handle_request(tenant):
     # Registrar la solicitud entrante
     app.logger.info("Received a request")
 
@@ -216,72 +338,123 @@ def handle_request(prompt, store_credentials=None):
         app.logger.error("Unauthorized access attempt due to invalid API key")
         abort(401, description="Unauthorized access: Invalid API key")
 
-    # Extraer el texto de consulta de la solicitud
-    req = request.get_json(silent=True, force=True)
+    # Atribuir el consumo de esta petición a la tienda y la ruta
+    accounting.set_scope(tenant, request.path)
+
+    # Extraer de la solicitud solo el texto, la sesión y el historial
+    body = request.get_data(cache=False)
+    cassettes.record_webhook(request.path, body)
+    turn_request = serialization.parse_turn_request(body)
 
-    if req is None or "queryResult" not in req:
+    if turn_request is None:
         app.logger.error("Invalid request payload: missing 'queryResult'")
         abort(400, description="Invalid request payload")
 
-    query_result = req.get("queryResult", {})
-    query = query_result.get("queryText", "")
+    query = turn_request.query
 
     if not query:
         app.logger.error("Query text is missing from the request")
         abort(400, description="Query text is missing")
 
     # Obtener el ID de sesión para identificar la conversación
-    session = req.get("session", "")
+    session = turn_request.session
     session_id = session.split("/")[-1]
 
     # Registrar el texto de la consulta y el ID de sesión
     app.logger.info(f"Received query: {query}")
     app.logger.info(f"Session ID: {session_id}")
 
-    # Obtener el historial de la conversación desde los contextos
-    output_contexts = query_result.get("outputContexts", [])
-    conversation_history = []
+    # Historial de la conversación tomado del contexto conversation_history, si existe
+    history_context = turn_request.history
+
+    # Agrupar mensajes seguidos de la sesión y responder los reintentos desde caché
+    response_id = turn_request.response_id
+    try:
+        payload = coalescing.submit(
+            f"{tenant}|{session_id}" if session_id else "",
+            response_id,
+            query,
+            lambda turn_query: run_turn(tenant, session, session_id, turn_query, history_context)
+        )
+    except Exception as e:
+        app.logger.error(f"Error processing turn for session {session_id}: {str(e)}")
+        payload = {"fulfillmentText": "Hubo un error procesando tu solicitud."}
+
+    return json_response(payload)
 
-    # Buscar el contexto de historial si existe
-    for context in output_contexts:
-        if "conversation_history" in context.get("name", ""):
-            conversation_history = context.get("parameters", {}).get("history", [])
-            break
+# Procesar un turno de conversación y devolver el payload para Dialogflow
+def run_turn(tenant, session, session_id, query, history_context):
+    # Prompt y credenciales de la tienda desde el registro de tenants
+    prompt = TENANTS[tenant]["prompt"]
+    store_credentials = TENANTS[tenant]["store_credentials"]
+
+    # Reutilizar el historial de la sesión en memoria o decodificarlo desde el contexto
+    try:
+        conversation_history = load_history(f"{tenant}|{session_id}", history_context)
+    except Exception as e:
+        app.logger.error(f"Error decoding conversation history: {str(e)}")
+        conversation_history = History()
 
     # Añadir el nuevo mensaje del usuario al historial
-    conversation_history.append({"role": "user", "content": query})
+    conversation_history.append("user", query)
 
     # Limitar el tamaño del historial si es necesario
     MAX_HISTORY_LENGTH = 50
-    if len(conversation_history) > MAX_HISTORY_LENGTH:
-        conversation_history = conversation_history[-MAX_HISTORY_LENGTH:]
-
-    # Construir la lista de mensajes para OpenAI
-    messages = [{"role": "system", "content": prompt}] + conversation_history
+    conversation_history.trim(MAX_HISTORY_LENGTH)
+
+    # Construir la lista de mensajes para OpenAI; los datos de producto van tras el prompt fijo
+    messages = [{"role": "system", "content": prompt}]
+    facts = catalog_feed.facts_message(tenant)
+    if facts is not None:
+        messages.append(facts)
+    messages += conversation_history.to_messages()
+
+    # Elegir modelo, tope de tokens y esfuerzo de razonamiento para este turno
+    route_name, route = routing.choose_route(TENANTS[tenant], conversation_history, query)
+    started_at = time.monotonic()
+    openai_response = None
+    action_name = None
+    action_ok = None
 
     # Llamar a la API de OpenAI para obtener una respuesta
     try:
-        openai_response = openai.chat.completions.create(
-            model="gpt-5-mini",
-            messages=messages,
-            max_completion_tokens=600,
-            reasoning_effort="minimal",
-        )
+        openai_response = openai.chat.completions.create(messages=messages, **route)
+        accounting.record_openai(openai_response.usage, time.monotonic() - started_at)
 
         # Extraer la respuesta generada por el modelo
-        response_text = openai_response.choices[0].message.content.strip()
+        response_text = (openai_response.choices[0].message.content or "").strip()
+
+        # Si la política ligera se queda sin tokens, repetir el turno con la estándar
+        if not response_text and route_name == "light":
+            route_name, route = "standard", routing.policy(TENANTS[tenant], "standard")
+            retry_started_at = time.monotonic()
+            openai_response = openai.chat.completions.create(messages=messages, **route)
+            accounting.record_openai(openai_response.usage, time.monotonic() - retry_started_at)
+            response_text = (openai_response.choices[0].message.content or "").strip()
 
         # Añadir la respuesta del asistente al historial
-        conversation_history.append({"role": "assistant", "content": response_text})
+        conversation_history.append("assistant", response_text)
 
         # Registrar la respuesta de OpenAI
         app.logger.info(f"OpenAI response: {response_text}")
 
+        # Repetir una muestra del turno contra las variantes del modo sombra, fuera de la petición
+        shadow.maybe_shadow(tenant, TENANTS[tenant], messages, {
+            **route,
+            "latency": time.monotonic() - started_at,
+            "usage": openai_response.usage,
+            "text": response_text,
+            "action": shadow.parse_action(response_text)[0],
+        })
+
         # Verificar si la respuesta contiene un comando de acción
         if "[ACTION]" in response_text:
-            action_response = handle_action(response_text, store_credentials)
+            action_match = re.search(r"\[ACTION\]\((\w+)\)", response_text)
+            action_name = action_match.group(1) if action_match else "unknown"
+            action_response = handle_action(response_text, store_credentials, locale_format.formatter_for(TENANTS[tenant]))
+            action_ok = action_response not in ACTION_FAILURE_RESPONSES and "[ACTION]" not in action_response
             # Añadir la respuesta de la acción al historial
-            conversation_history.append({"role": "assistant", "content": action_response})
+            conversation_history.append("assistant", action_response)
             # Actualizar el texto de respuesta
             response_text = action_response
 
@@ -290,6 +463,23 @@ def handle_request(prompt, store_credentials=None):
         app.logger.error(f"Error when calling OpenAI API: {str(e)}")
         response_text = "Hubo un error procesando tu solicitud."
 
+    accounting.record_turn()
+
+    # Registrar el resultado del turno para ajustar la política de enrutamiento
+    routing.record_outcome(
+        tenant,
+        route_name,
+        route["model"],
+        time.monotonic() - started_at,
+        usage=getattr(openai_response, "usage", None),
+        action=action_name,
+        action_ok=action_ok,
+        error=openai_response is None,
+    )
+
+    # Guardar la sesión en memoria para el siguiente turno
+    sessions.set(f"{tenant}|{session_id}", conversation_history)
+
     # Preparar el contexto de salida para mantener el historial
     context_name = f"{session}/contexts/conversation_history"
     lifespan_count = 20  # Puedes ajustar este valor
@@ -298,20 +488,113 @@ def handle_request(prompt, store_credentials=None):
         "name": context_name,
         "lifespanCount": lifespan_count,
         "parameters": {
-            "history": conversation_history
+            "history": conversation_history.to_context()
         },
     }
 
     # Preparar la respuesta para Dialogflow, incluyendo el contexto de salida
-    return jsonify({
+    return {
         "fulfillmentText": response_text,
         "outputContexts": [output_context],
+    }
+
+# Readiness para el balanceador: solo responde 200 cuando terminó el warm-up
+@app.route("/llm-integration/ready", methods=["GET"])
+def readiness():
+    if lifecycle.state["draining"]:
+        return jsonify({"status": "draining"}), 503
+    if not warmup.state["ready"]:
+        return jsonify({"status": "warming_up"}), 503
+    started_at, finished_at = warmup.state["started_at"], warmup.state["finished_at"]
+    return jsonify({
+        "status": "ready",
+        "warmup_seconds": round(finished_at - started_at, 2) if started_at and finished_at else None,
+        "stores": warmup.state["stores"],
     })
 
-# Ruta para el agente de DestiladosColombia con integración WooCommerce
-@app.route("/llm-integration/destiladoscolombia", methods=["POST"])
-def webhook_destiladoscolombia():
-    prompt = (
+# Resultados agregados de la política de enrutamiento por tenant
+@app.route("/llm-integration/admin/routing", methods=["GET"])
+def routing_report():
+    if not check_admin_key():
+        abort(401, description="Unauthorized access: Invalid admin key")
+    return json_response(routing.routing_stats())
+
+# Comparación de las variantes del modo sombra por tenant
+@app.route("/llm-integration/admin/shadow", methods=["GET"])
+def shadow_report():
+    if not check_admin_key():
+        abort(401, description="Unauthorized access: Invalid admin key")
+    return json_response(shadow.report(request.args.get("tenant")))
+
+# Consultar o cambiar en caliente la configuración del perfilado
+@app.route("/llm-integration/admin/profiling", methods=["GET", "POST"])
+def profiling_admin():
+    if not check_admin_key():
+        abort(401, description="Unauthorized access: Invalid admin key")
+    if request.method == "POST":
+        changes = request.get_json(silent=True, force=True) or {}
+        try:
+            result = profiling.configure(changes)
+        except ValueError as e:
+            abort(400, description=f"Invalid profiling configuration: {e}")
+        app.logger.info(f"Profiling configuration changed: {changes}")
+        return json_response(result)
+    return json_response(profiling.status())
+
+# Webhooks de WooCommerce: mantienen al día el estado de los pedidos sin consultar la API
+@app.route("/woocommerce/<tenant>/webhook", methods=["POST"])
+def woocommerce_webhook(tenant):
+    if tenant not in TENANTS:
+        abort(404, description="Unknown store")
+    store_credentials = TENANTS[tenant]["store_credentials"]
+
+    # WooCommerce envía un ping sin tema ni firma al crear el webhook
+    topic = request.headers.get("X-WC-Webhook-Topic")
+    if topic is None:
+        return json_response({"status": "ok"})
+
+    secret = store_credentials.get('webhook_secret')
+    signature = request.headers.get("X-WC-Webhook-Signature", "")
+    body = request.get_data()
+    expected = base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii") if secret else None
+    if expected is None or not hmac.compare_digest(expected, signature):
+        app.logger.error(f"Invalid WooCommerce webhook signature for {tenant}")
+        abort(401, description="Invalid webhook signature")
+
+    if not topic.startswith("order."):
+        return json_response({"status": "ignored", "topic": topic})
+
+    try:
+        order = serialization.loads(body or b"{}")
+    except ValueError:
+        order = None
+    if not isinstance(order, dict):
+        abort(400, description="Invalid order payload")
+    applied = woocommerce_logic.ingest_order_event(store_credentials['store_url'], topic, order)
+    app.logger.info(f"Webhook {topic} de {tenant} para el pedido {order.get('id')}: {'aplicado' if applied else 'ignorado'}")
+    return json_response({"status": "applied" if applied else "ignored"})
+
+# Consumo diario por tienda y ruta: ?tenant=&route=&from=AAAA-MM-DD&to=AAAA-MM-DD
+@app.route("/llm-integration/admin/usage", methods=["GET"])
+def usage_report():
+    if not check_admin_key():
+        abort(401, description="Unauthorized access: Invalid admin key")
+    return json_response(accounting.query_usage(
+        tenant=request.args.get("tenant"),
+        route=request.args.get("route"),
+        start_day=request.args.get("from"),
+        end_day=request.args.get("to"),
+    ))
+
+# Uso de memoria de las cachés por tienda, peticiones en curso y desalojos
+@app.route("/llm-integration/admin/memory", methods=["GET"])
+def memory_report():
+    if not check_admin_key():
+        abort(401, description="Unauthorized access: Invalid admin key")
+    return json_response(memory.usage())
+
+# Prompt del agente de DestiladosColombia con integración WooCommerce
+PROMPT_DESTILADOSCOLOMBIA = (
         "Eres una experta en atención al cliente, tu nombre es ganyah. Tu objetivo es vender productos de Destiladoscolombia.co, una tienda que vende destilados de THC. Enfoca tus respuestas en los beneficios del destilado de THC en la salud y explicame que se puede fumar sin incomadar a nadie en lugares sociales como centros comerciales, resaltando su calidad, durabilidad y pureza. Comunícate de manera amigable, usa un tono cercano y emoticones; tútea al cliente y mantén las respuestas en máximo 430 caracteres. Solo saluda en el primer mensaje y usa saltos de línea para claridad. No inventes datos y sientete libre de modificar tus respuesta para sonar mas amigable y lograr que el cliente compre."
 
         "Instrucciones:"
@@ -417,19 +700,16 @@ def webhook_destiladoscolombia():
         "• Si el cliente solicita ayuda para realizar un pedido y expresa dificultades técnicas."
         "• Si el cliente está listo para compartir datos personales y necesita seguridad adicional."
         "En estos casos, responde: Voy a transferirte con un especialista que puede ayudarte mejor con este tema. Un momento, por favor."
-    )
-    store_credentials = {
-        'store_url': 'https://destiladoscolombia.co',
-        'consumer_key': os.getenv("DESTILADOS_CONSUMER_KEY"),
-        'consumer_secret': os.getenv("DESTILADOS_CONSUMER_SECRET")
-    }
-    return handle_request(prompt, store_credentials)
+)
+
+# Ruta para el agente de DestiladosColombia con integración WooCommerce
+@app.route("/llm-integration/destiladoscolombia", methods=["POST"])
+def webhook_destiladoscolombia():
+    return handle_request("destiladoscolombia")
 
 # Puedes agregar más rutas para otros agentes de la misma manera
 
-@app.route("/llm-integration/destilados", methods=["POST"])
-def webhook_destilados():
-    prompt = (
+PROMPT_DESTILADOS = (
         "Eres Eva, Experta en Servicio al Cliente de la marca Swiss Home. Tu objetivo es vender productos de la marca Swisshome, cunto te pregunte que quieren saber sobre las ollas o bateria o set principalmente son las ollas de 13 piezas y 21 piezas, nuestros productos sirven para todo tipo de estufas "
         "Enfoca tus respuestas en los beneficios de cocinar con acero quirúrgico para la salud, resaltando su calidad y durabilidad."
         "Nuestras ollas son Calibre 316L El acero, 316L contiene aproximadamente 16-18% de cromo, 10-14% de níquel y 2-3% de molibdeno. La adición de molibdeno lo hace más resistente a la corrosión, especialmente contra agentes agresivos como el agua salina y ciertos químicos industriales"
@@ -526,17 +806,13 @@ def webhook_destilados():
         "Si la respuesta del cliente tiene la frase: la imagen contiene ; es por que te envio una imagen, respondele como si el cliente estuvera consultado sobre eso"
 
         "Transfiere el chat a un humano en cualquiera de las siguientes situaciones: Si el cliente está irritado, molesto, insatisfecho, frustrado, etc.; Afirma que esta conversación es inútil, frustrante, inadecuada, ineficaz e incompetente; El cliente envía un enlace desconocido; El cliente pide explícitamente hablar con un humano, persona, representante, gerente, administrador, operador, agente de servicio al cliente, o menciona la necesidad de interactuar con una 'persona real'; Solicitudes para finalizar la conversación y dejar de chatear, etc.; Cuando no sabes qué responder; Cuando quieren el envío con una transportadora específica; Si el cliente está listo para enviar datos personales para hacer la compra y necesita asegurarse de que su información está siendo procesada de forma segura. No inventes datos y en cualquiera de esos casos dile Voy a transferirte con un especialista que puede ayudarle mejor con este tema. Un momento, por favor."
-    )
-    store_credentials = {
-        'store_url': 'https://swisshome.com.co',
-        'consumer_key': os.getenv("SWISSHOME_CONSUMER_KEY"),
-        'consumer_secret': os.getenv("SWISSHOME_CONSUMER_SECRET")
-    }
-    return handle_request(prompt, store_credentials)
+)
 
-@app.route("/llm-integration", methods=["POST"])
-def webhook():
-    prompt = (
+@app.route("/llm-integration/destilados", methods=["POST"])
+def webhook_destilados():
+    return handle_request("destilados")
+
+PROMPT_DEFAULT = (
         "Eres un asistente virtual para WhatChat.co tu nombre es Mr. What, una plataforma que centraliza la gestión de "
         "conversaciones de múltiples canales en un solo lugar. Tu objetivo es guiar a los visitantes a "
         "través de las características del producto, los diferentes planes disponibles y ayudarles a "
@@ -562,17 +838,13 @@ def webhook():
         "gusto hablar contigo. Si necesitas más ayuda, aquí estaré. ¡Que tengas un excelente día!, para "
         "trata de no extenderte en la respuesta usa un máximo de 430 caracteres en tus respuestas y solo saluda en el primer mensaje"
         "Transfiere el chat a un humano en cualquiera de las siguientes situaciones: Si el cliente está irritado, molesto, insatisfecho, frustrado, etc.; Afirma que esta conversación es inútil, frustrante, inadecuada, ineficaz e incompetente; El cliente envía un enlace desconocido; El cliente pide explícitamente hablar con un humano, persona, representante, gerente, administrador, operador, agente de servicio al cliente, o menciona la necesidad de interactuar con una 'persona real'; Solicitudes para finalizar la conversación y dejar de chatear, etc.; Cuando no sabes qué responder; Cuando quieren el envío con una transportadora específica; Cuando el cliente envíe algún archivo multimedia como audio (.mp3), imagen (.jpg) o video (.mp4); Cuando el cliente solicita ayuda para realizar un pedido por el mismo chat y expresa dificultades o desconocimiento sobre cómo usar la página o tecnologías relacionadas; Si el cliente está listo para enviar datos personales para hacer la compra y necesita asegurarse de que su información está siendo procesada de forma segura, cuando te pidan fotos o videos de algún producto. No inventes datos, en cualquiera de eso casos dices transfiere a un humano y dile Voy a transferirte con un especialista que puede ayudarle mejor con este tema. Un momento, por favor."
-    )
-    store_credentials = {
-        'store_url': 'https://destiladoscolombia.co',
-        'consumer_key': os.getenv("DESTILADOS_CONSUMER_KEY"),
-        'consumer_secret': os.getenv("DESTILADOS_CONSUMER_SECRET")
-    }
-    return handle_request(prompt, store_credentials)
+)
 
-@app.route("/llm-integration/relojeria", methods=["POST"])
-def webhook_relojeria():
-    prompt = (
+@app.route("/llm-integration", methods=["POST"])
+def webhook():
+    return handle_request("default")
+
+PROMPT_RELOJERIA = (
         "Eres Alex, Especialista en Servicio al Cliente de Relojeria.com.co. Tu objetivo es asesorar a los clientes sobre nuestra selección de réplicas AAA de relojes de lujo, no tienes que estar mencionando que son replicas triple AAA, solo si el cliente lo prenguta, conocidos por su alta calidad, precisión y detalles idénticos a los modelos originales. Al responder, enfócate en resaltar la apariencia auténtica, materiales de alta calidad y el proceso de fabricación detallado que distingue nuestras réplicas AAA como las mejores del mercado."
         "Enfoca tus respuestas en las características de los productos, como la calidad de los materiales, el diseño moderno y su comodidad. Resalta las ofertas actuales, como descuentos de hasta el 55porciento, Por ejemplo:"
 
@@ -635,17 +907,13 @@ def webhook_relojeria():
         "Asegúrate de que todos los valores estén entre comillas dobles y utiliza el código de país \"CO\". Verifica que todas las comas estén correctamente colocadas entre los pares clave-valor y que envias un Json valido. Después de generar el comando de acción, continúa la conversación habitual con el cliente."
 
         "Transfiere el chat a un humano en cualquiera de las siguientes situaciones: Si el cliente está irritado, molesto, insatisfecho, frustrado, etc.; Afirma que esta conversación es inútil, frustrante, inadecuada, ineficaz e incompetente; El cliente envía un enlace desconocido; El cliente pide explícitamente hablar con un humano, persona, representante, gerente, administrador, operador, agente de servicio al cliente, o menciona la necesidad de interactuar con una 'persona real'; Solicitudes para finalizar la conversación y dejar de chatear, etc.; Cuando no sabes qué responder; Cuando quieren el envío con una transportadora específica; Si el cliente está listo para enviar datos personales para hacer la compra y necesita asegurarse de que su información está siendo procesada de forma segura, cuando te pidan fotos o videos de algún producto distintos a los dos primeros productos Rolex Submariner y Rolex Presidencial. No inventes datos, en cualquiera de esos casos dices transfiere a un humano y dile Voy a transferirte con un especialista que puede ayudarle mejor con este tema. Un momento, por favor."
-    )
-    store_credentials = {
-        'store_url': 'https://relojeria.com.co',
-        'consumer_key': os.getenv("RELOJERIA_CONSUMER_KEY"),
-        'consumer_secret': os.getenv("RELOJERIA_CONSUMER_SECRET")
-    }
-    return handle_request(prompt, store_credentials)
+)
 
-@app.route("/llm-integration/streetcolombia", methods=["POST"])
-def webhook_streetcolombia():
-    prompt = (
+@app.route("/llm-integration/relojeria", methods=["POST"])
+def webhook_relojeria():
+    return handle_request("relojeria")
+
+PROMPT_STREETCOLOMBIA = (
         "Eres Sofía, experta en servicio al cliente de la marca Street Colombia. Tu objetivo es vender sandalias y productos relacionados de la tienda online Street Colombia, destacando siempre los beneficios de las sandalias más populares como las Adidas Yeezy Foam Runner y las Crocs LiteRide™, resaltando su comodidad, estilo y los grandes descuentos exclusivos. "
         
         "Enfoca tus respuestas en las características de los productos, como la calidad de los materiales, el diseño moderno y su comodidad. Resalta las ofertas actuales, como descuentos de hasta el 69%, y menciona que son ideales tanto para el día a día como para ocasiones especiales. "
@@ -699,18 +967,13 @@ def webhook_streetcolombia():
         "`[ACTION](place_order) {\"billing\": {\"first_name\": \"\", \"last_name\": \"\", \"address_1\": \"\", \"city\": \"\", \"state\": \"\", \"country\": \"CO\", \"email\": \"\", \"phone\": \"\"}, \"shipping\": {\"first_name\": \"\", \"last_name\": \"\", \"address_1\": \"\", \"city\": \"\", \"state\": \"\", \"country\": \"CO\"}, \"payment_method\": \"cod\", \"payment_method_title\": \"Pago contra Entrega\", \"set_paid\": true, \"status\": \"processing\", \"line_items\": [{\"product_id\": \"\", \"quantity\": \"\"}]}` "
         
         "Transfiere el chat a un humano en cualquiera de las siguientes situaciones: ..."
-    )
+)
 
-    store_credentials = {
-        'store_url': 'https://streetcolombia.com',
-        'consumer_key': os.getenv("STREET_CONSUMER_KEY"),
-        'consumer_secret': os.getenv("STREET_CONSUMER_SECRET")
-    }
-    return handle_request(prompt, store_credentials)
+@app.route("/llm-integration/streetcolombia", methods=["POST"])
+def webhook_streetcolombia():
+    return handle_request("streetcolombia")
 
-@app.route("/llm-integration/juguetelandia", methods=["POST"])
-def webhook_juguetelandia():
-    prompt = (
+PROMPT_JUGUETELANDIA = (
         "Eres Luisa, Especialista en Servicio al Cliente de Juguetelandia.net. estas ubicados en bogota y somos bodega, Tu objetivo es asesorar a los clientes sobre nuestra selección de juguetes destacados, conocidos por su alta calidad, diseño innovador y capacidad para estimular la imaginación de los niños. Al responder, enfócate en resaltar la seguridad de los materiales, la facilidad de uso y las características únicas que distinguen nuestros productos en el mercado."
         
         "Los pedidos aun llegan antes del 24 de diciembre, RECUERDA QUE SI TE PREGUNTAN POR LAS PISTAS DE PAW PATROL o cual queier cosa de paw patrol o paw patrol RESPONDER POR LA PISTA A CONTINUACIÓN. No te apresures a pedir los datos para tomar el pedido si no hasta que el cliente lo manifieste. Enfoca tus respuestas en las características de los productos, como la calidad de los materiales, el diseño atractivo y su capacidad para fomentar el desarrollo infantil. Resalta las ofertas actuales. Por ejemplo, si te preguntan por pistas de Paw Patrol:"
@@ -773,17 +1036,13 @@ def webhook_juguetelandia():
         "Asegúrate de que todos los valores estén entre comillas dobles y utiliza el código de país \"CO\". Verifica que todas las comas estén correctamente colocadas entre los pares clave-valor y que envias un Json valido. Después de generar el comando de acción, continúa la conversación habitual con el cliente."
 
         "Transfiere el chat a un humano en cualquiera de las siguientes situaciones: Si el cliente está irritado, molesto, insatisfecho, frustrado, etc.; Afirma que esta conversación es inútil, frustrante, inadecuada, ineficaz e incompetente; El cliente pide explícitamente hablar con un humano, persona, representante, gerente, administrador, operador, agente de servicio al cliente, o menciona la necesidad de interactuar con una 'persona real'; Solicitudes para finalizar la conversación y dejar de chatear, etc.; Cuando no sabes qué responder; Cuando quieren el envío con una transportadora específica; Cuando el cliente solicita ayuda para realizar un pedido por el mismo chat y expresa dificultades o desconocimiento sobre cómo usar la página o tecnologías relacionadas; Si el cliente está listo para enviar datos personales para hacer la compra y necesita asegurarse de que su información está siendo procesada de forma segura, cuando te pidan fotos o videos de algún producto. No inventes datos, en cualquiera de eso casos dices transfiere a un humano y dile Voy a transferirte con un especialista que puede ayudarle mejor con este tema. Un momento, por favor."
-    )
-    store_credentials = {
-        'store_url': 'https://juguetelandia.net',
-        'consumer_key': os.getenv("JUGUETES_CONSUMER_KEY"),
-        'consumer_secret': os.getenv("JUGUETES_CONSUMER_SECRET")
-    }
-    return handle_request(prompt, store_credentials)
+)
 
-@app.route("/llm-integration/econi", methods=["POST"])
-def webhook_econi():
-    prompt = (
+@app.route("/llm-integration/juguetelandia", methods=["POST"])
+def webhook_juguetelandia():
+    return handle_request("juguetelandia")
+
+PROMPT_ECONI = (
         "Eres Sofia, experta en servicio al cliente de Econi Perú (https://econi.com.pe/). Tu objetivo es vender maquinaria y herramientas de la tienda online, destacando siempre los beneficios de los productos más populares como la Electrobomba Pedrollo PKm60 de 0.5 HP y la Motosierra STIHL RE 110, resaltando su alto rendimiento, durabilidad y los descuentos exclusivos de hasta 30 %. "
 
         "Enfoca tus respuestas en las características clave de cada equipo —potencia del motor, eficiencia energética, calidad de los materiales y facilidad de mantenimiento—, y resalta nuestras promociones actuales, como envío gratis a Lima Metropolitana, asesoría técnica postventa y financiamiento en cuotas sin interés. Usa un tono cercano y profesional, proponiendo soluciones concretas a las necesidades del cliente."
@@ -814,14 +1073,106 @@ def webhook_econi():
         "Cuando tengas todos estos datos, envía toda la información del cliente junto con el nombre del producto que quiere comprar en el mismo chat con el cliente y luego lo transfieres a un especialista. "
         
         "Si el cliente prefiere realizar la compra a través de la página web, explícale cómo hacerlo y envíale el enlace correspondiente. "
-    )
+)
 
-    store_credentials = {
-        'store_url': 'https://econi.com.pe/',
-        'consumer_key': os.getenv("ECONI_CONSUMER_KEY"),
-        'consumer_secret': os.getenv("ECONI_CONSUMER_SECRET")
-    }
-    return handle_request(prompt, store_credentials)
+@app.route("/llm-integration/econi", methods=["POST"])
+def webhook_econi():
+    return handle_request("econi")
+
+# Registro de tiendas: prompt del agente y credenciales de WooCommerce por tenant
+TENANTS = {
+    "destiladoscolombia": {
+        "prompt": PROMPT_DESTILADOSCOLOMBIA,
+        # Sección de precios y stock del catálogo en el prompt
+        "catalog_facts": True,
+        # Productos mencionados en el prompt, para la sección de precios y stock
+        "featured_products": [15953],
+        "store_credentials": {
+            'store_url': 'https://destiladoscolombia.co',
+            'consumer_key': os.getenv("DESTILADOS_CONSUMER_KEY"),
+            'consumer_secret': os.getenv("DESTILADOS_CONSUMER_SECRET"),
+            'webhook_secret': os.getenv("DESTILADOS_WEBHOOK_SECRET")
+        },
+    },
+    "destilados": {
+        "prompt": PROMPT_DESTILADOS,
+        # Sección de precios y stock del catálogo en el prompt
+        "catalog_facts": True,
+        # Productos mencionados en el prompt, para la sección de precios y stock
+        "featured_products": [20732, 21379, 21648, 22851, 22879, 21582, 21672, 23582, 20715, 22267, 22845, 21145, 21556],
+        "store_credentials": {
+            'store_url': 'https://swisshome.com.co',
+            'consumer_key': os.getenv("SWISSHOME_CONSUMER_KEY"),
+            'consumer_secret': os.getenv("SWISSHOME_CONSUMER_SECRET"),
+            'webhook_secret': os.getenv("SWISSHOME_WEBHOOK_SECRET")
+        },
+    },
+    "default": {
+        "prompt": PROMPT_DEFAULT,
+        "store_credentials": {
+            'store_url': 'https://destiladoscolombia.co',
+            'consumer_key': os.getenv("DESTILADOS_CONSUMER_KEY"),
+            'consumer_secret': os.getenv("DESTILADOS_CONSUMER_SECRET"),
+            'webhook_secret': os.getenv("DESTILADOS_WEBHOOK_SECRET")
+        },
+    },
+    "relojeria": {
+        "prompt": PROMPT_RELOJERIA,
+        # Sección de precios y stock del catálogo en el prompt
+        "catalog_facts": True,
+        # Productos mencionados en el prompt, para la sección de precios y stock
+        "featured_products": [27724, 27701],
+        "store_credentials": {
+            'store_url': 'https://relojeria.com.co',
+            'consumer_key': os.getenv("RELOJERIA_CONSUMER_KEY"),
+            'consumer_secret': os.getenv("RELOJERIA_CONSUMER_SECRET"),
+            'webhook_secret': os.getenv("RELOJERIA_WEBHOOK_SECRET")
+        },
+    },
+    "streetcolombia": {
+        "prompt": PROMPT_STREETCOLOMBIA,
+        # Sección de precios y stock del catálogo en el prompt
+        "catalog_facts": True,
+        "store_credentials": {
+            'store_url': 'https://streetcolombia.com',
+            'consumer_key': os.getenv("STREET_CONSUMER_KEY"),
+            'consumer_secret': os.getenv("STREET_CONSUMER_SECRET"),
+            'webhook_secret': os.getenv("STREET_WEBHOOK_SECRET")
+        },
+    },
+    "juguetelandia": {
+        "prompt": PROMPT_JUGUETELANDIA,
+        # Sección de precios y stock del catálogo en el prompt
+        "catalog_facts": True,
+        # Productos mencionados en el prompt, para la sección de precios y stock
+        "featured_products": [24386, 23694],
+        "store_credentials": {
+            'store_url': 'https://juguetelandia.net',
+            'consumer_key': os.getenv("JUGUETES_CONSUMER_KEY"),
+            'consumer_secret': os.getenv("JUGUETES_CONSUMER_SECRET"),
+            'webhook_secret': os.getenv("JUGUETES_WEBHOOK_SECRET")
+        },
+    },
+    "econi": {
+        "prompt": PROMPT_ECONI,
+        # Sección de precios y stock del catálogo en el prompt
+        "catalog_facts": True,
+        "store_credentials": {
+            'store_url': 'https://econi.com.pe/',
+            'consumer_key': os.getenv("ECONI_CONSUMER_KEY"),
+            'consumer_secret': os.getenv("ECONI_CONSUMER_SECRET"),
+            'webhook_secret': os.getenv("ECONI_WEBHOOK_SECRET")
+        },
+        # Formato de respaldo si las claves no pueden leer los ajustes de la tienda (Perú)
+        "locale": {
+            "currency": "PEN",
+            "currency_position": "left_space",
+            "thousand_separator": ",",
+            "decimal_separator": ".",
+            "decimals": 2,
+        },
+    },
+}
 
 
 if __name__ == "__main__":
@@ -829,4 +1180,20 @@ if __name__ == "__main__":
     host = os.getenv("FLASK_HOST", "127.0.0.1")
     port = int(os.getenv("FLASK_PORT", 5000))
 
+    # Drenar peticiones y pedidos en curso al recibir SIGTERM
+    lifecycle.install_signal_handlers()
+    # Crear los pedidos que quedaron pendientes en la ejecución anterior
+    lifecycle.replay_pending_orders(process_order)
+
+    # Volcar periódicamente el consumo de tokens y llamadas a SQLite
+    accounting.start()
+
+    # Precargar prompts, cachés, ajustes y conexiones antes de recibir tráfico; después
+    # precalcular el formato de precios de cada tienda y mantener al día precios y stock
+    def on_ready():
+        locale_format.build_all(TENANTS)
+        catalog_feed.start(TENANTS)
+
+    warmup.start_warm_up(TENANTS, on_ready=on_ready)
+
     app.run(host=host, port=port, debug=False, threaded=True)
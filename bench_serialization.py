@@ -0,0 +1,108 @@
+import random
+import sys
+import time
+
+from flask import Flask, jsonify
+
+import serialization
+from history import History
+
+# Micro-benchmark del camino de petición/respuesta de Dialogflow:
+# request.get_json + jsonify (anterior) frente a serialization (actual).
+# Uso: python bench_serialization.py [iteraciones]
+
+HISTORY_LENGTHS = (0, 10, 25, 50)
+MESSAGE = (
+    "Hola, quiero saber si el reloj de acero con correa de cuero está disponible en color negro "
+    "y cuánto tarda el envío a Medellín. ¿Aceptan pago contra entrega o solo transferencia? "
+)
+
+
+# Mensajes distintos en cada turno para que la compresión del historial sea realista
+def _history(turns):
+    words = MESSAGE.split()
+    rng = random.Random(turns)
+    history = History()
+    for index in range(turns):
+        text = " ".join(rng.choice(words) for _ in range(60)) + f" {rng.randrange(10 ** 6)}"
+        history.append("user" if index % 2 == 0 else "assistant", text)
+    return history
+
+
+def _request_body(history):
+    session = "projects/tienda/agent/sessions/5f1c2b7e-0000-4000-8000-000000000000"
+    payload = {
+        "responseId": "b1b2c3d4-e5f6-0000-1111-222233334444-0820055c",
+        "session": session,
+        "queryResult": {
+            "queryText": MESSAGE,
+            "languageCode": "es",
+            "intent": {"name": f"{session}/intents/fallback", "displayName": "Default Fallback Intent"},
+            "outputContexts": [
+                {"name": f"{session}/contexts/__system_counters__", "parameters": {"no-input": 0, "no-match": 1}},
+                {
+                    "name": f"{session}/contexts/conversation_history",
+                    "lifespanCount": 19,
+                    "parameters": {"history": history.to_context()},
+                },
+            ],
+        },
+        "originalDetectIntentRequest": {"source": "whatsapp", "payload": {}},
+    }
+    return serialization.dumps(payload), session
+
+
+def _response_payload(history, session):
+    return {
+        "fulfillmentText": MESSAGE,
+        "outputContexts": [{
+            "name": f"{session}/contexts/conversation_history",
+            "lifespanCount": 20,
+            "parameters": {"history": history.to_context()},
+        }],
+    }
+
+
+# Camino anterior: parseo completo con el proveedor JSON de Flask y jsonify
+def previous_path(app, body, response):
+    req = app.json.loads(body)
+    query_result = req.get("queryResult", {})
+    for context in query_result.get("outputContexts", []):
+        if "conversation_history" in context.get("name", ""):
+            context.get("parameters", {}).get("history")
+            break
+    return jsonify(response).get_data()
+
+
+def current_path(app, body, response):
+    serialization.parse_turn_request(body)
+    return serialization.dumps_response(response)
+
+
+def _timeit(fn, app, body, response, iterations):
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        fn(app, body, response)
+    return (time.perf_counter() - started_at) / iterations * 1e6
+
+
+def run(iterations=2000):
+    app = Flask(__name__)
+    results = []
+    with app.app_context():
+        for turns in HISTORY_LENGTHS:
+            history = _history(turns)
+            body, session = _request_body(history)
+            response = _response_payload(history, session)
+            previous = _timeit(previous_path, app, body, response, iterations)
+            current = _timeit(current_path, app, body, response, iterations)
+            results.append((turns, len(body), previous, current))
+    return results
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"backend: {serialization.backend}")
+    print(f"{'turnos':>7} {'bytes':>8} {'anterior (µs)':>14} {'actual (µs)':>12} {'mejora':>7}")
+    for turns, size, previous, current in run(iterations):
+        print(f"{turns:>7} {size:>8} {previous:>14.1f} {current:>12.1f} {previous / current:>6.1f}x")
@@ -0,0 +1,147 @@
+import itertools
+import sys
+import threading
+import time
+
+import serialization
+
+# Todas las cachés creadas, para que el gobernador de memoria pueda medirlas y vaciarlas
+registry = []
+# Función llamada (fuera del lock) cuando una caché crece: on_grow(cache, bucket)
+on_grow = None
+
+# Orden global de escritura, para desalojar la entrada más antigua entre todas las cachés
+_sequence = itertools.count()
+
+
+# Tamaño aproximado en bytes de un valor guardado en caché
+def estimate_size(value):
+    approx_size = getattr(value, "approx_size", None)
+    if approx_size is not None:
+        return approx_size()
+    try:
+        return len(serialization.dumps(value))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+# Grupo de presupuesto de una clave: el prefijo antes de "|" (tienda o tenant)
+def bucket_of(key):
+    prefix, separator, _ = key.partition("|")
+    return prefix if separator else "_shared"
+
+
+# Caché en memoria con expiración por entrada, segura entre hilos.
+# Las claves son cadenas para que el contenido se pueda guardar en el snapshot JSON.
+class TTLCache:
+    def __init__(self, name, ttl, maxsize=1000):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.bytes = 0
+        self.bucket_bytes = {}
+        # clave -> (expira_en, valor, tamaño, secuencia); ordenado de más antigua a más reciente
+        self._data = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        bucket = bucket_of(key)
+        self.bytes -= entry[2]
+        self.bucket_bytes[bucket] -= entry[2]
+        if not self.bucket_bytes[bucket]:
+            del self.bucket_bytes[bucket]
+
+    def _insert(self, key, expires_at, value, size):
+        bucket = bucket_of(key)
+        self._data[key] = (expires_at, value, size, next(_sequence))
+        self.bytes += size
+        self.bucket_bytes[bucket] = self.bucket_bytes.get(bucket, 0) + size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[0] < time.time():
+                self._remove(key)
+                return default
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (ttl if ttl is not None else self.ttl)
+        size = estimate_size(value)
+        with self._lock:
+            self._remove(key)
+            self._insert(key, expires_at, value, size)
+            # Descartar las entradas más antiguas si se supera el tamaño máximo
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+        if on_grow is not None:
+            on_grow(self, bucket_of(key))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    # Eliminar todas las entradas cuya clave empieza por prefix
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+            self.bucket_bytes.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    # Entrada más antigua (secuencia, clave), opcionalmente solo de un grupo; None si no hay
+    def oldest(self, bucket=None):
+        with self._lock:
+            for key, entry in self._data.items():
+                if bucket is None or bucket_of(key) == bucket:
+                    return entry[3], key
+        return None
+
+    # Eliminar las entradas vencidas; devuelve los bytes liberados
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            before = self.bytes
+            for key in [key for key, entry in self._data.items() if entry[0] < now]:
+                self._remove(key)
+            return before - self.bytes
+
+    # Exportar las entradas vigentes como {clave: [expira_en, valor]}
+    def dump(self):
+        now = time.time()
+        with self._lock:
+            return {
+                key: [entry[0], entry[1]]
+                for key, entry in self._data.items()
+                if entry[0] >= now
+            }
+
+    # Restaurar entradas exportadas con dump(), ignorando las ya vencidas
+    def load(self, entries):
+        now = time.time()
+        restored = 0
+        with self._lock:
+            for key, (expires_at, value) in entries.items():
+                if expires_at >= now:
+                    self._remove(key)
+                    self._insert(key, expires_at, value, estimate_size(value))
+                    restored += 1
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+        if on_grow is not None and restored:
+            on_grow(self, None)
+        return restored
@@ -0,0 +1,339 @@
+import atexit
+import contextvars
+import hashlib
+import inspect
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import openai
+from openai.types.chat import ChatCompletion
+
+import catalog_feed
+import coalescing
+import lifecycle
+import woocommerce_logic
+
+# Modo de las cassettes: "off", "record" (llamadas reales, se guardan) o "replay" (se sirven desde disco)
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "cassettes")
+CASSETTE_NAME = os.getenv("CASSETTE_NAME", "default")
+# En replay: fracción de la latencia grabada que se reproduce (0 responde al instante, 1 la original)
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", 0))
+# En replay: latencia fija adicional en milisegundos por llamada
+CASSETTE_LATENCY_MS = float(os.getenv("CASSETTE_LATENCY_MS", 0))
+
+# Funciones de woocommerce_logic que se graban; las llamadas anidadas solo cuentan la externa
+WOO_FUNCTIONS = (
+    "create_order",
+    "find_order_by_meta",
+    "get_order",
+    "search_products",
+    "get_variations",
+    "get_variations_many",
+    "load_catalog",
+    "fetch_catalog_changes",
+    "load_store_settings",
+)
+# Argumentos que no se guardan en disco ni forman parte de la clave
+SECRET_ARGS = {"consumer_key", "consumer_secret"}
+# Metadatos de pedido que cambian en cada ejecución (ID del job de lifecycle); no forman parte de la clave
+VOLATILE_META = {"_llm_order_job"}
+
+
+# Llamada sin grabación en la cassette activa
+class CassetteMiss(LookupError):
+    pass
+
+
+_active = None
+_originals = {}
+_nested = contextvars.ContextVar("cassette_nested", default=False)
+
+
+# Los dicts con claves no textuales (p. ej. {product_id: variaciones}) se guardan como pares
+def _encode(value):
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _encode(item) for key, item in value.items()}
+        return {"__pairs__": [[key, _encode(item)] for key, item in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {"__pairs__"}:
+            return {key: _decode(item) for key, item in value["__pairs__"]}
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+# Parámetros de OpenAI que identifican la llamada: sin la sección de datos de producto,
+# que depende del estado del feed de catálogo al grabar
+def _openai_request(params):
+    messages = [
+        message for message in params.get("messages", [])
+        if not (message.get("role") == "system" and str(message.get("content", "")).startswith(catalog_feed.FACTS_HEADER))
+    ]
+    return {**params, "messages": messages}
+
+
+def _key(target, request):
+    raw = json.dumps([target, request], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    def __init__(self, name, mode):
+        self.name = name
+        self.mode = mode
+        self.path = os.path.join(CASSETTE_DIR, f"{name}.json")
+        self.interactions = []
+        self.webhooks = []
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        self._lock = threading.Lock()
+        # clave -> respuestas pendientes, en el orden en que se grabaron
+        self._queues = defaultdict(deque)
+        if mode == "replay":
+            self.load()
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.interactions = data.get("interactions", [])
+        self.webhooks = data.get("webhooks", [])
+        # Mismo estado de prompts y formato de precios que al grabar
+        catalog_feed.prompt_facts.update(data.get("prompt_facts", {}))
+        for key, settings in data.get("store_settings", {}).items():
+            woocommerce_logic.settings_cache.set(key, settings)
+        for interaction in self.interactions:
+            self._queues[interaction["key"]].append(interaction)
+
+    def save(self):
+        os.makedirs(CASSETTE_DIR, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            data = {
+                "recorded_at": time.time(),
+                "interactions": self.interactions,
+                "webhooks": self.webhooks,
+                "prompt_facts": dict(catalog_feed.prompt_facts),
+                "store_settings": {key: entry[1] for key, entry in woocommerce_logic.settings_cache.dump().items()},
+            }
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def record(self, kind, target, request, response=None, error=None, latency=0.0):
+        with self._lock:
+            self.interactions.append({
+                "kind": kind,
+                "target": target,
+                "key": _key(target, request),
+                "request": request,
+                "response": response,
+                "error": error,
+                "latency": latency,
+            })
+            self.stats["recorded"] += 1
+
+    # Siguiente respuesta grabada para la petición; la última se repite si se piden más
+    def next(self, target, request):
+        key = _key(target, request)
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"Sin grabación para {target} en la cassette {self.name}")
+            interaction = queue.popleft() if len(queue) > 1 else queue[0]
+            self.stats["replayed"] += 1
+        delay = interaction["latency"] * CASSETTE_LATENCY_SCALE + CASSETTE_LATENCY_MS / 1000.0
+        if delay > 0:
+            time.sleep(delay)
+        if interaction["error"] is not None:
+            raise RuntimeError(interaction["error"])
+        return interaction["response"]
+
+
+def _without_volatile_meta(order_data):
+    if not isinstance(order_data, dict) or not order_data.get("meta_data"):
+        return order_data
+    meta_data = [meta for meta in order_data["meta_data"] if meta.get("key") not in VOLATILE_META]
+    return {**order_data, "meta_data": meta_data}
+
+
+def _woo_request(function, args, kwargs):
+    bound = inspect.signature(function).bind(*args, **kwargs)
+    request = {name: _encode(value) for name, value in bound.arguments.items() if name not in SECRET_ARGS}
+    if "order_data" in request:
+        request["order_data"] = _without_volatile_meta(request["order_data"])
+    return request
+
+
+def _wrap_woo(name, function):
+    def wrapper(*args, **kwargs):
+        cassette = _active
+        if cassette is None or _nested.get():
+            return function(*args, **kwargs)
+        request = _woo_request(function, args, kwargs)
+        if cassette.mode == "replay":
+            return _decode(cassette.next(name, request))
+
+        token = _nested.set(True)
+        started_at = time.monotonic()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            cassette.record("woocommerce", name, request, error=str(e), latency=time.monotonic() - started_at)
+            raise
+        finally:
+            _nested.reset(token)
+        cassette.record("woocommerce", name, request, response=_encode(result), latency=time.monotonic() - started_at)
+        return result
+
+    wrapper.__wrapped__ = function
+    wrapper.__name__ = name
+    return wrapper
+
+
+# Sustituto de openai.chat: graba o sirve chat.completions.create
+class _Completions:
+    def __init__(self, original_chat):
+        self._original_chat = original_chat
+
+    def create(self, **params):
+        cassette = _active
+        if cassette is None:
+            return self._original_chat.completions.create(**params)
+        request = _openai_request(params)
+        if cassette.mode == "replay":
+            return ChatCompletion.model_validate(cassette.next("chat.completions.create", request))
+
+        started_at = time.monotonic()
+        try:
+            response = self._original_chat.completions.create(**params)
+        except Exception as e:
+            cassette.record("openai", "chat.completions.create", request, error=str(e), latency=time.monotonic() - started_at)
+            raise
+        cassette.record("openai", "chat.completions.create", request, response=response.model_dump(mode="json"), latency=time.monotonic() - started_at)
+        return response
+
+
+class _Chat:
+    def __init__(self, original_chat):
+        self.completions = _Completions(original_chat)
+
+
+# Activar una cassette: parchea openai.chat, las funciones de woocommerce_logic y los
+# nombres importados con "from woocommerce_logic import ..." en los módulos indicados
+def install(name=CASSETTE_NAME, mode=CASSETTE_MODE, modules=()):
+    global _active
+    if mode not in ("record", "replay"):
+        return None
+    if not _originals:
+        _originals["openai.chat"] = openai.chat
+        openai.chat = _Chat(_originals["openai.chat"])
+        for function_name in WOO_FUNCTIONS:
+            function = getattr(woocommerce_logic, function_name)
+            _originals[function_name] = function
+            setattr(woocommerce_logic, function_name, _wrap_woo(function_name, function))
+    for module in modules:
+        for function_name in WOO_FUNCTIONS:
+            if getattr(module, function_name, None) is _originals[function_name]:
+                setattr(module, function_name, getattr(woocommerce_logic, function_name))
+
+    _active = Cassette(name, mode)
+    if mode == "record":
+        atexit.register(_active.save)
+    logging.info(f"Cassette {name} activa en modo {mode}")
+    return _active
+
+
+# Desactivar la cassette (y guardarla si se estaba grabando); los parches quedan como paso directo
+def uninstall():
+    global _active
+    cassette, _active = _active, None
+    if cassette is not None and cassette.mode == "record":
+        cassette.save()
+    return cassette
+
+
+@contextmanager
+def use_cassette(name, mode="replay", modules=()):
+    cassette = install(name, mode, modules)
+    try:
+        yield cassette
+    finally:
+        uninstall()
+
+
+def recording():
+    return _active is not None and _active.mode == "record"
+
+
+# Guardar la petición entrante de un webhook (sin cabeceras ni claves) para repetir la conversación completa
+def record_webhook(path, body):
+    if recording():
+        with _active._lock:
+            _active.webhooks.append({"path": path, "body": body.decode("utf-8")})
+
+
+# Repetir todas las peticiones grabadas contra la app en modo replay y medir la latencia por ruta.
+# Sin espera de agrupación, para que la latencia medida sea solo la de la app y la simulada.
+# Los pedidos se registran en archivos temporales, no en los pendientes reales de lifecycle,
+# y se espera a que terminen antes de desactivar la cassette.
+def run(name, app_module):
+    timings = defaultdict(list)
+    debounce, coalescing.DEBOUNCE_SECONDS = coalescing.DEBOUNCE_SECONDS, 0
+    order_paths = lifecycle.PENDING_ORDERS_PATH, lifecycle.DEAD_ORDERS_PATH
+    orders_dir = tempfile.mkdtemp(prefix="cassette-orders-")
+    lifecycle.PENDING_ORDERS_PATH = os.path.join(orders_dir, "pending_orders.json")
+    lifecycle.DEAD_ORDERS_PATH = os.path.join(orders_dir, "dead_orders.json")
+    try:
+        with use_cassette(name, "replay", modules=(app_module,)) as cassette:
+            client = app_module.app.test_client()
+            headers = {"X-API-Key": app_module.API_KEY} if app_module.API_KEY else {}
+            for webhook in cassette.webhooks:
+                started_at = time.perf_counter()
+                response = client.post(webhook["path"], data=webhook["body"].encode("utf-8"), headers=headers)
+                timings[webhook["path"]].append(time.perf_counter() - started_at)
+                if response.status_code != 200:
+                    logging.error(f"{webhook['path']} respondió {response.status_code} en replay")
+            if not lifecycle.wait_idle(lifecycle.DRAIN_TIMEOUT):
+                logging.error("Quedaron pedidos sin terminar en replay")
+            stats = dict(cassette.stats)
+    finally:
+        coalescing.DEBOUNCE_SECONDS = debounce
+        lifecycle.PENDING_ORDERS_PATH, lifecycle.DEAD_ORDERS_PATH = order_paths
+        shutil.rmtree(orders_dir, ignore_errors=True)
+    report = {
+        path: {
+            "requests": len(values),
+            "avg_ms": round(sum(values) / len(values) * 1000, 2),
+            "max_ms": round(max(values) * 1000, 2),
+        }
+        for path, values in timings.items()
+    }
+    return report, stats
+
+
+# Uso: CASSETTE_LATENCY_SCALE=1 python cassettes.py <cassette>
+if __name__ == "__main__":
+    import app
+
+    name = sys.argv[1] if len(sys.argv) > 1 else CASSETTE_NAME
+    report, stats = run(name, app)
+    for path, entry in sorted(report.items()):
+        print(f"{path:<40} n={entry['requests']:<5} media {entry['avg_ms']} ms  máx {entry['max_ms']} ms")
+    print(f"respuestas servidas {stats['replayed']}, sin grabación {stats['misses']}")
@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import locale_format
+import woocommerce_logic
+
+# Cada cuántos segundos se consultan los cambios de catálogo de cada tienda
+FEED_INTERVAL = int(os.getenv("CATALOG_FEED_INTERVAL", 300))
+# Productos más vendidos que se añaden a la sección de datos de cada tenant
+FACTS_TOP_SELLERS = int(os.getenv("CATALOG_FACTS_TOP_SELLERS", 8))
+# Margen para no perder cambios por diferencias de reloj con la tienda
+SYNC_OVERLAP = timedelta(seconds=60)
+
+# Comienzo del mensaje de sistema con los datos de producto
+FACTS_HEADER = "Precios y disponibilidad actualizados"
+
+# Sección de datos de producto por tenant: {"version", "hash", "message"}
+prompt_facts = {}
+_last_sync = {}
+_lock = threading.Lock()
+
+
+def _stock_label(product):
+    status = product.get('stock_status')
+    if status == 'instock':
+        quantity = product.get('stock_quantity')
+        return f"disponible ({quantity} unidades)" if quantity else "disponible"
+    if status == 'onbackorder':
+        return "bajo pedido"
+    return "agotado"
+
+
+# Construir la sección compacta de precios y stock para un tenant
+def build_facts(tenant_config):
+    catalog = woocommerce_logic.get_catalog(tenant_config["store_credentials"]['store_url']) or []
+    by_id = {product['id']: product for product in catalog}
+
+    selected = [by_id[product_id] for product_id in tenant_config.get("featured_products", []) if product_id in by_id]
+    selected_ids = {product['id'] for product in selected}
+    top_sellers = sorted(catalog, key=lambda product: product.get('total_sales') or 0, reverse=True)
+    added = 0
+    for product in top_sellers:
+        if added >= FACTS_TOP_SELLERS:
+            break
+        if product['id'] not in selected_ids:
+            selected.append(product)
+            selected_ids.add(product['id'])
+            added += 1
+
+    if not selected:
+        return None
+    formatter = locale_format.formatter_for(tenant_config)
+    lines = [
+        f"- {product.get('name')} (ID {product['id']}): precio {formatter.price(product.get('price'))}, {_stock_label(product)}"
+        for product in selected
+    ]
+    return "\n".join(lines)
+
+
+# Regenerar la sección de un tenant; la versión solo cambia si cambia el contenido.
+# Solo los tenants con "catalog_facts" reciben la sección (no los que comparten tienda sin venderla).
+def refresh_facts(tenant, tenant_config):
+    if not tenant_config.get("catalog_facts"):
+        return
+    facts = build_facts(tenant_config)
+    if facts is None:
+        return
+    digest = hashlib.sha1(facts.encode("utf-8")).hexdigest()[:12]
+    with _lock:
+        current = prompt_facts.get(tenant)
+        if current is not None and current["hash"] == digest:
+            return
+        version = current["version"] + 1 if current else 1
+        prompt_facts[tenant] = {
+            "version": version,
+            "hash": digest,
+            "message": {
+                "role": "system",
+                "content": (
+                    f"{FACTS_HEADER} (v{version}-{digest}). "
+                    "Si difieren de los indicados en tus instrucciones, usa estos:\n" + facts
+                ),
+            },
+        }
+    logging.info(f"Datos de producto de {tenant} actualizados a la versión {version}")
+
+
+# Mensaje de sistema con los datos de producto del tenant, si existe.
+# Va después del prompt principal para no romper la caché de prefijo del prompt.
+def facts_message(tenant):
+    facts = prompt_facts.get(tenant)
+    return facts["message"] if facts else None
+
+
+# Traer los cambios de catálogo de una tienda desde la última sincronización
+def sync_store(store_credentials):
+    store = woocommerce_logic.store_key(store_credentials['store_url'])
+    started_at = datetime.now(timezone.utc)
+    catalog = woocommerce_logic.get_catalog(store_credentials['store_url'])
+    since = _last_sync.get(store)
+    # Primera pasada con catálogo ya cargado: continuar desde su última modificación
+    if since is None and catalog:
+        modified = [product['date_modified_gmt'] for product in catalog if product.get('date_modified_gmt')]
+        if modified:
+            since = (datetime.fromisoformat(max(modified)) - SYNC_OVERLAP).strftime("%Y-%m-%dT%H:%M:%S")
+
+    if since is None or catalog is None:
+        woocommerce_logic.load_catalog(
+            store_url=store_credentials['store_url'],
+            consumer_key=store_credentials['consumer_key'],
+            consumer_secret=store_credentials['consumer_secret']
+        )
+        changed = None
+    else:
+        changes = woocommerce_logic.fetch_catalog_changes(
+            store_url=store_credentials['store_url'],
+            consumer_key=store_credentials['consumer_key'],
+            consumer_secret=store_credentials['consumer_secret'],
+            since=since
+        )
+        changed = woocommerce_logic.apply_catalog_changes(store_credentials['store_url'], changes)
+
+    # Renovar los ajustes de moneda cuando vencen en caché
+    if woocommerce_logic.get_store_settings(store_credentials['store_url']) is None:
+        woocommerce_logic.load_store_settings(
+            store_url=store_credentials['store_url'],
+            consumer_key=store_credentials['consumer_key'],
+            consumer_secret=store_credentials['consumer_secret']
+        )
+
+    _last_sync[store] = (started_at - SYNC_OVERLAP).strftime("%Y-%m-%dT%H:%M:%S")
+    return changed
+
+
+# Una pasada del feed: sincronizar cada tienda y regenerar los prompts afectados
+def run_once(tenants):
+    synced = set()
+    for tenant, tenant_config in tenants.items():
+        credentials = tenant_config["store_credentials"]
+        if not credentials.get('consumer_key') or not credentials.get('consumer_secret'):
+            continue
+        store = woocommerce_logic.store_key(credentials['store_url'])
+        if store not in synced:
+            synced.add(store)
+            try:
+                sync_store(credentials)
+            except Exception as e:
+                logging.error(f"Error sincronizando el catálogo de {store}: {e}")
+        refresh_facts(tenant, tenant_config)
+
+
+def _feed_loop(tenants):
+    while True:
+        run_once(tenants)
+        time.sleep(FEED_INTERVAL)
+
+
+# Iniciar el feed de catálogo en segundo plano
+def start(tenants):
+    # Los catálogos restaurados en el warm-up ya sirven para la primera versión
+    for tenant, tenant_config in tenants.items():
+        refresh_facts(tenant, tenant_config)
+    if FEED_INTERVAL > 0:
+        threading.Thread(target=_feed_loop, args=(tenants,), daemon=True).start()
@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+
+from cache import TTLCache
+
+# Ventana en segundos para agrupar mensajes seguidos de la misma sesión (0 la desactiva).
+# Solo se espera cuando llegan mensajes en ráfaga; un mensaje aislado se procesa al momento.
+DEBOUNCE_SECONDS = float(os.getenv("COALESCE_DEBOUNCE_SECONDS", 0.8))
+# Espera máxima acumulando mensajes antes de llamar al modelo
+MAX_WAIT_SECONDS = float(os.getenv("COALESCE_MAX_WAIT_SECONDS", 2.5))
+# Tiempo máximo que una petición espera el resultado de otra
+RESULT_TIMEOUT = float(os.getenv("COALESCE_RESULT_TIMEOUT", 30))
+
+# Respuestas ya enviadas, por responseId de Dialogflow, para contestar los reintentos
+responses = TTLCache("responses", ttl=300, maxsize=5000)
+# Sesiones que recibieron un mensaje dentro de la ventana
+_recent = TTLCache("coalesce_recent", ttl=DEBOUNCE_SECONDS, maxsize=10000)
+
+_lock = threading.Lock()
+# responseId en proceso -> evento que se activa cuando su respuesta está en caché
+_inflight = {}
+# Lote abierto (aún acumulando mensajes) por sesión ("tenant|ID de sesión")
+_open_batches = {}
+# Último lote de cada sesión, para procesar los turnos en orden
+_last_batches = {}
+
+
+class _Batch:
+    __slots__ = ("queries", "started_at", "last_at", "previous", "done", "result")
+
+    def __init__(self, previous):
+        self.queries = []
+        self.started_at = time.monotonic()
+        self.last_at = self.started_at
+        self.previous = previous
+        self.done = threading.Event()
+        self.result = None
+
+
+# Respuesta para los mensajes absorbidos por otro turno: un payload personalizado
+# que los canales de texto ignoran, para no enviar respuestas duplicadas
+def _absorbed(payload):
+    return {
+        "fulfillmentMessages": [{"payload": {"coalesced": True}}],
+        "outputContexts": payload.get("outputContexts", []),
+    }
+
+
+# Unirse al lote abierto de la sesión o abrir uno; devuelve (lote, líder, índice, inmediato).
+# El lote es inmediato si la sesión no tiene mensajes recientes ni un turno en curso.
+def _join_batch(session_id, query):
+    with _lock:
+        batch = _open_batches.get(session_id)
+        leader = batch is None
+        immediate = False
+        if leader:
+            previous = _last_batches.get(session_id)
+            immediate = previous is None and _recent.get(session_id) is None
+            batch = _Batch(previous)
+            _open_batches[session_id] = batch
+            _last_batches[session_id] = batch
+        batch.queries.append(query)
+        batch.last_at = time.monotonic()
+        index = len(batch.queries) - 1
+    if DEBOUNCE_SECONDS > 0:
+        _recent.set(session_id, True)
+    return batch, leader, index, immediate
+
+
+def _run_batch(session_id, batch, process, immediate=False):
+    # Esperar a que la sesión deje de recibir mensajes durante la ventana (salvo mensaje aislado)
+    while not immediate:
+        with _lock:
+            remaining = min(batch.last_at + DEBOUNCE_SECONDS, batch.started_at + MAX_WAIT_SECONDS) - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(remaining)
+    with _lock:
+        if _open_batches.get(session_id) is batch:
+            del _open_batches[session_id]
+
+    # Un turno anterior de la misma sesión debe terminar antes (historial consistente)
+    if batch.previous is not None:
+        batch.previous.done.wait(RESULT_TIMEOUT)
+        batch.previous = None
+
+    try:
+        batch.result = process("\n".join(batch.queries))
+    finally:
+        batch.done.set()
+        with _lock:
+            if _last_batches.get(session_id) is batch:
+                del _last_batches[session_id]
+
+
+# Procesar un mensaje agrupándolo con los mensajes seguidos de la misma sesión.
+# session_id debe identificar también al tenant (p. ej. "tenant|ID de sesión").
+# process recibe el texto combinado y devuelve el payload de respuesta para Dialogflow.
+def submit(session_id, response_id, query, process):
+    owner = False
+    if response_id:
+        with _lock:
+            cached = responses.get(response_id)
+            event = _inflight.get(response_id) if cached is None else None
+            if cached is None and event is None:
+                _inflight[response_id] = threading.Event()
+                owner = True
+        if cached is not None:
+            logging.info(f"Respuesta en caché para el reintento {response_id}")
+            return cached
+        if event is not None:
+            event.wait(RESULT_TIMEOUT)
+            cached = responses.get(response_id)
+            if cached is not None:
+                return cached
+
+    try:
+        if not session_id:
+            payload = process(query)
+        else:
+            batch, leader, index, immediate = _join_batch(session_id, query)
+            if leader:
+                _run_batch(session_id, batch, process, immediate)
+            elif not batch.done.wait(RESULT_TIMEOUT):
+                raise TimeoutError(f"Timed out waiting for coalesced turn of session {session_id}")
+            if batch.result is None:
+                raise RuntimeError(f"Coalesced turn of session {session_id} failed")
+            # Solo el último mensaje del lote lleva la respuesta del modelo
+            payload = batch.result if index == len(batch.queries) - 1 else _absorbed(batch.result)
+
+        if response_id:
+            responses.set(response_id, payload)
+        return payload
+    finally:
+        if owner:
+            with _lock:
+                event = _inflight.pop(response_id, None)
+            if event is not None:
+                event.set()
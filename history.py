@@ -0,0 +1,190 @@
+import base64
+import os
+import uuid
+import zlib
+from array import array
+
+import serialization
+from cache import TTLCache
+
+# zstandard es opcional; si no está instalado se comprime con zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Turnos recientes que se mantienen sin comprimir
+HOT_TURNS = int(os.getenv("HISTORY_HOT_TURNS", 10))
+# Turnos que se archivan (comprimidos) de una sola vez
+ARCHIVE_BATCH = int(os.getenv("HISTORY_ARCHIVE_BATCH", 10))
+# Sesiones guardadas en memoria y su tiempo de vida en segundos
+SESSION_TTL = int(os.getenv("SESSION_TTL", 3600))
+SESSION_MAX = int(os.getenv("SESSION_MAX", 20000))
+
+ROLES = ("system", "user", "assistant")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+# Prefijos del formato compacto enviado en el contexto de Dialogflow. La versión 2 guarda
+# [conversación, contador de turnos, pares]; la 1 (solo pares) se sigue leyendo.
+_ZSTD_PREFIX = "zs2:"
+_ZLIB_PREFIX = "zl2:"
+_LEGACY_PREFIXES = ("zs1:", "zl1:")
+
+if zstandard is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+
+
+def _compress(data):
+    if zstandard is not None:
+        return _zstd_compressor.compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data):
+    if zstandard is not None and data[:4] == b"\x28\xb5\x2f\xfd":
+        return _zstd_decompressor.decompress(data)
+    return zlib.decompress(data)
+
+
+class Turn:
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
+
+
+# Historial de conversación con roles en un array de bytes y turnos antiguos comprimidos
+# conversation identifica la conversación y turn cuenta los turnos añadidos (no baja con trim);
+# juntos indican si un contexto de Dialogflow está desactualizado respecto a la memoria
+class History:
+    __slots__ = ("_roles", "_contents", "_archive", "_archive_len", "encoded", "conversation", "turn")
+
+    def __init__(self, turns=(), conversation=None, turn=None):
+        self._roles = array("B")
+        self._contents = []
+        self._archive = None
+        self._archive_len = 0
+        # Última versión codificada para el contexto; permite reutilizar el objeto
+        self.encoded = None
+        self.conversation = conversation or uuid.uuid4().hex[:12]
+        self.turn = 0
+        for role, content in turns:
+            self.append(role, content)
+        if turn is not None:
+            self.turn = turn
+
+    def __len__(self):
+        return self._archive_len + len(self._contents)
+
+    def _archived_pairs(self):
+        if self._archive is None:
+            return []
+        return serialization.loads(_decompress(self._archive))
+
+    def _set_archive(self, pairs):
+        self._archive = _compress(serialization.dumps(pairs)) if pairs else None
+        self._archive_len = len(pairs)
+
+    def append(self, role, content):
+        self._roles.append(ROLE_CODES[role])
+        self._contents.append(content)
+        self.turn += 1
+        self.encoded = None
+        # Comprimir por lotes para no recomprimir el archivo en cada turno
+        if len(self._contents) > HOT_TURNS + ARCHIVE_BATCH:
+            pairs = self._archived_pairs()
+            pairs.extend(zip(self._roles[:ARCHIVE_BATCH], self._contents[:ARCHIVE_BATCH]))
+            self._set_archive(pairs)
+            del self._roles[:ARCHIVE_BATCH]
+            del self._contents[:ARCHIVE_BATCH]
+
+    # Conservar solo los últimos max_turns turnos
+    def trim(self, max_turns):
+        excess = len(self) - max_turns
+        if excess <= 0:
+            return
+        self.encoded = None
+        if excess < self._archive_len:
+            self._set_archive(self._archived_pairs()[excess:])
+            return
+        excess -= self._archive_len
+        self._set_archive([])
+        del self._roles[:excess]
+        del self._contents[:excess]
+
+    def turns(self):
+        for code, content in self._archived_pairs():
+            yield Turn(ROLES[code], content)
+        for code, content in zip(self._roles, self._contents):
+            yield Turn(ROLES[code], content)
+
+    # Bytes aproximados que ocupa el historial (para el presupuesto de memoria)
+    def approx_size(self):
+        return (
+            sum(len(content) for content in self._contents)
+            + (len(self._archive) if self._archive is not None else 0)
+            + 64 * len(self._contents)
+            + 200
+        )
+
+    # Últimos n turnos, sin descomprimir el archivo si no hace falta
+    def recent(self, n):
+        if n > len(self._contents) and self._archive is not None:
+            return list(self.turns())[-n:]
+        start = max(len(self._contents) - n, 0)
+        return [Turn(ROLES[code], content) for code, content in zip(self._roles[start:], self._contents[start:])]
+
+    # Lista de mensajes en el formato de la API de OpenAI
+    def to_messages(self):
+        return [turn.to_dict() for turn in self.turns()]
+
+    # Representación compacta para el contexto de Dialogflow
+    def to_context(self):
+        if self.encoded is None:
+            pairs = self._archived_pairs()
+            pairs.extend(zip(self._roles, self._contents))
+            raw = _compress(serialization.dumps([self.conversation, self.turn, pairs]))
+            prefix = _ZSTD_PREFIX if zstandard is not None else _ZLIB_PREFIX
+            self.encoded = prefix + base64.b64encode(raw).decode("ascii")
+        return self.encoded
+
+    # Reconstruir el historial desde el contexto (formato compacto o lista de dicts)
+    @classmethod
+    def from_context(cls, value):
+        if not value:
+            return cls()
+        if isinstance(value, str):
+            if value.startswith(_ZSTD_PREFIX) and zstandard is None:
+                raise ValueError("History encoded with zstd but zstandard is not installed")
+            data = serialization.loads(_decompress(base64.b64decode(value.split(":", 1)[1])))
+            if value[:4] in _LEGACY_PREFIXES:
+                return cls((ROLES[code], content) for code, content in data)
+            conversation, turn, pairs = data
+            history = cls(((ROLES[code], content) for code, content in pairs), conversation, turn)
+            history.encoded = value
+            return history
+        return cls((item.get("role", "user"), item.get("content", "")) for item in value)
+
+
+# Sesiones activas en memoria, por "tenant|ID de sesión de Dialogflow"
+sessions = TTLCache("sessions", ttl=SESSION_TTL, maxsize=SESSION_MAX)
+
+
+# Obtener el historial de la sesión, reutilizando el objeto en memoria si el contexto no cambió.
+# Si el contexto llega desactualizado (turnos seguidos de la misma conversación) gana la memoria;
+# sin contexto (conversación nueva o contexto caducado) se empieza de cero.
+def load_history(session_key, context_value):
+    if not context_value:
+        return History()
+    history = sessions.get(session_key)
+    if history is not None and context_value == history.encoded:
+        return history
+    from_context = History.from_context(context_value)
+    if history is not None and history.conversation == from_context.conversation and history.turn > from_context.turn:
+        return history
+    return from_context
@@ -0,0 +1,209 @@
+import contextvars
+import json
+import logging
+import os
+import signal
+import threading
+import time
+import uuid
+
+# Pedidos aceptados que aún no se han creado en WooCommerce; se reintentan al arrancar
+PENDING_ORDERS_PATH = os.getenv("PENDING_ORDERS_PATH", "pending_orders.json")
+# Pedidos descartados (rechazados por la tienda o sin crear tras los reintentos), para revisarlos a mano
+DEAD_ORDERS_PATH = os.getenv("DEAD_ORDERS_PATH", "dead_orders.json")
+# Intentos máximos de un pedido (el primero incluido) y antigüedad máxima en segundos para reintentarlo
+ORDER_MAX_ATTEMPTS = int(os.getenv("ORDER_MAX_ATTEMPTS", 5))
+ORDER_MAX_AGE = int(os.getenv("ORDER_MAX_AGE", 24 * 3600))
+# Segundos máximos que se espera a las peticiones y pedidos en curso al recibir SIGTERM
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 25))
+# Segundos sugeridos en Retry-After mientras la instancia se apaga
+DRAIN_RETRY_AFTER = int(os.getenv("DRAIN_RETRY_AFTER", 5))
+
+# Estado del apagado, consultado por el endpoint de readiness
+state = {"draining": False, "drain_started_at": None}
+
+# Resultado de run(job) cuando la tienda rechaza el pedido y no tiene sentido reintentarlo
+REJECTED = "rejected"
+
+_inflight = 0
+_idle = threading.Condition()
+_jobs = {}
+_jobs_lock = threading.Lock()
+_file_lock = threading.Lock()
+
+
+def _read_pending(path=None):
+    try:
+        with open(path or PENDING_ORDERS_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.error(f"Error leyendo los pedidos pendientes: {e}")
+        return {}
+
+
+# Reescribir el archivo de pedidos pendientes (o descartados) de forma atómica
+def _write_pending(pending, path=None):
+    path = path or PENDING_ORDERS_PATH
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pending, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.error(f"Error guardando los pedidos pendientes: {e}")
+
+
+def _persist(job_id, job):
+    with _file_lock:
+        pending = _read_pending()
+        pending[job_id] = job
+        _write_pending(pending)
+
+
+def _forget(job_id):
+    with _file_lock:
+        pending = _read_pending()
+        if pending.pop(job_id, None) is not None:
+            _write_pending(pending)
+
+
+# Pasar un pedido de pendientes a DEAD_ORDERS_PATH con el motivo
+def _dead_letter(job_id, job, reason):
+    logging.error(f"Pedido {job_id} descartado ({reason}); se guarda en {DEAD_ORDERS_PATH}")
+    with _file_lock:
+        pending = _read_pending()
+        if pending.pop(job_id, None) is not None:
+            _write_pending(pending)
+        dead = _read_pending(DEAD_ORDERS_PATH)
+        dead[job_id] = {**job, "reason": reason, "dead_at": time.time()}
+        _write_pending(dead, DEAD_ORDERS_PATH)
+
+
+def request_started():
+    global _inflight
+    with _idle:
+        _inflight += 1
+
+
+def request_finished():
+    global _inflight
+    with _idle:
+        _inflight -= 1
+        if not _inflight:
+            _idle.notify_all()
+
+
+# run(job) devuelve True cuando el pedido quedó creado y REJECTED si la tienda lo rechazó;
+# si falla, el pedido sigue en PENDING_ORDERS_PATH y se reintenta en el próximo arranque
+def _run_job(job_id, job, run):
+    try:
+        result = run(job)
+        if result == REJECTED:
+            _dead_letter(job_id, job, REJECTED)
+        elif result:
+            _forget(job_id)
+        else:
+            logging.error(f"El pedido {job_id} no se creó; queda pendiente para reintentarlo")
+    except Exception as e:
+        logging.error(f"Error en el pedido {job_id}: {e}")
+    finally:
+        with _jobs_lock:
+            _jobs.pop(job_id, None)
+        with _idle:
+            _idle.notify_all()
+
+
+# El hilo hereda el contexto de la petición (tenant del consumo, etc.)
+def _start_job(job_id, job, run):
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(_run_job, job_id, job, run), daemon=True, name=f"order-{job_id[:8]}")
+    with _jobs_lock:
+        _jobs[job_id] = thread
+    thread.start()
+
+
+# Registrar un pedido en disco antes de crearlo en segundo plano con run(job).
+# job debe ser serializable en JSON y no incluir credenciales.
+def submit_order(job, run):
+    job_id = uuid.uuid4().hex
+    job = {**job, "job_id": job_id, "accepted_at": time.time(), "attempts": 1}
+    _persist(job_id, job)
+    _start_job(job_id, job, run)
+    return job_id
+
+
+# Relanzar los pedidos que quedaron sin crear en la ejecución anterior; llevan "replayed"
+# para que run compruebe antes si el pedido llegó a crearse. Los que agotaron los intentos
+# o superan ORDER_MAX_AGE se descartan. Devuelve cuántos se relanzaron.
+def replay_pending_orders(run):
+    with _file_lock:
+        pending = _read_pending()
+    started = 0
+    for job_id, job in pending.items():
+        attempts = job.get("attempts", 1) + 1
+        if attempts > ORDER_MAX_ATTEMPTS:
+            _dead_letter(job_id, job, "max_attempts")
+            continue
+        if time.time() - job.get("accepted_at", 0) > ORDER_MAX_AGE:
+            _dead_letter(job_id, job, "expired")
+            continue
+        logging.info(f"Reintentando el pedido pendiente {job_id} aceptado en {job.get('accepted_at')} (intento {attempts})")
+        job = {**job, "attempts": attempts}
+        _persist(job_id, job)
+        _start_job(job_id, {**job, "replayed": True}, run)
+        started += 1
+    return started
+
+
+def pending_jobs():
+    with _jobs_lock:
+        return len(_jobs)
+
+
+# Esperar a que terminen las peticiones y los pedidos en curso; devuelve True si terminaron a tiempo
+def wait_idle(timeout):
+    deadline = time.monotonic() + timeout
+    with _idle:
+        while _inflight or pending_jobs():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            _idle.wait(remaining)
+    return True
+
+
+def _drain():
+    started_at = time.monotonic()
+    finished = wait_idle(DRAIN_TIMEOUT)
+    if finished:
+        logging.info(f"Drenado completado en {time.monotonic() - started_at:.1f}s")
+    else:
+        # Los pedidos sin terminar siguen en PENDING_ORDERS_PATH y se reintentan al arrancar
+        logging.error(f"Drenado incompleto tras {DRAIN_TIMEOUT}s: {_inflight} peticiones y {pending_jobs()} pedidos en curso")
+    # Detener el servidor con un segundo SIGTERM; los manejadores de atexit vuelcan el consumo,
+    # el snapshot y los logs
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def begin_drain():
+    if state["draining"]:
+        return
+    state["draining"] = True
+    state["drain_started_at"] = time.time()
+    logging.info("SIGTERM recibido: rechazando webhooks nuevos y esperando los que están en curso")
+    threading.Thread(target=_drain, daemon=True).start()
+
+
+# El primer SIGTERM inicia el drenado; el siguiente (enviado al terminar o por el operador) detiene el proceso
+def _handle_sigterm(signum, frame):
+    if not state["draining"]:
+        begin_drain()
+        return
+    raise SystemExit(0)
+
+
+# Instalar el manejador de SIGTERM (solo desde el hilo principal)
+def install_signal_handlers():
+    signal.signal(signal.SIGTERM, _handle_sigterm)
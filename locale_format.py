@@ -0,0 +1,132 @@
+import logging
+import threading
+
+import woocommerce_logic
+
+# Símbolos de las monedas de las tiendas; las demás se muestran con su código ISO
+CURRENCY_SYMBOLS = {
+    "COP": "$",
+    "PEN": "S/",
+    "USD": "$",
+    "MXN": "$",
+    "CLP": "$",
+    "ARS": "$",
+    "EUR": "€",
+}
+
+# Posición del símbolo según woocommerce_currency_pos
+CURRENCY_PATTERNS = {
+    "left": "{symbol}{amount}",
+    "right": "{amount}{symbol}",
+    "left_space": "{symbol} {amount}",
+    "right_space": "{amount} {symbol}",
+}
+
+# Textos de estado de pedido, en el idioma de las respuestas del webhook; cada tenant puede
+# sobrescribirlos con "order_statuses"
+ORDER_STATUSES = {
+    "pending": "Pendiente de pago",
+    "on-hold": "En espera de confirmación",
+    "processing": "Pedido enviado a la transportadora",
+    "completed": "Pedido entregado",
+    "cancelled": "Pedido cancelado",
+    "refunded": "Pedido reembolsado",
+    "failed": "Pago fallido",
+}
+
+# Formato usado si la tienda no expone sus ajustes y el tenant no define "locale"
+DEFAULT_LOCALE = {
+    "currency": "COP",
+    "currency_position": "left",
+    "thousand_separator": ".",
+    "decimal_separator": ",",
+    "decimals": 0,
+}
+
+# Ajustes de WooCommerce -> claves de locale
+_SETTING_KEYS = {
+    "woocommerce_currency": "currency",
+    "woocommerce_currency_pos": "currency_position",
+    "woocommerce_price_thousand_sep": "thousand_separator",
+    "woocommerce_price_decimal_sep": "decimal_separator",
+    "woocommerce_price_num_decimals": "decimals",
+}
+
+_formatters = {}
+_lock = threading.Lock()
+
+
+# Formateador de precios, estados y artículos de una tienda, con todo precalculado
+class Formatter:
+    def __init__(self, locale, order_statuses=None):
+        self.currency = locale["currency"]
+        self.decimals = int(locale["decimals"])
+        self._pattern = CURRENCY_PATTERNS.get(locale["currency_position"], CURRENCY_PATTERNS["left"])
+        self._symbol = CURRENCY_SYMBOLS.get(self.currency, self.currency)
+        # Se formatea con separadores "," y "." y se cambian por los de la tienda en una pasada
+        self._separators = str.maketrans({",": locale["thousand_separator"], ".": locale["decimal_separator"]})
+        self._number_format = f",.{self.decimals}f"
+        self._statuses = {**ORDER_STATUSES, **(order_statuses or {})}
+
+    def number(self, value):
+        return format(float(value), self._number_format).translate(self._separators)
+
+    # Precio con símbolo; currency permite mostrar pedidos hechos en otra moneda
+    def price(self, value, currency=None):
+        if value in (None, ""):
+            return "N/A"
+        try:
+            amount = self.number(value)
+        except (TypeError, ValueError):
+            return str(value)
+        symbol = self._symbol if currency in (None, self.currency) else CURRENCY_SYMBOLS.get(currency, currency)
+        return self._pattern.format(symbol=symbol, amount=amount)
+
+    def order_status(self, status):
+        return self._statuses.get(status, status)
+
+    # "nombre: cantidad x precio unitario" de un artículo del pedido
+    def line_item(self, item, currency=None):
+        quantity = item.get('quantity') or 1
+        unit_price = item.get('price')
+        if unit_price in (None, "") and item.get('total') not in (None, ""):
+            try:
+                unit_price = float(item['total']) / quantity
+            except (TypeError, ValueError):
+                unit_price = item['total']
+        return f"{item.get('name', 'Producto sin nombre')}: {quantity} x {self.price(unit_price, currency)}"
+
+
+# Formato de la tienda: sus ajustes de WooCommerce primero; "locale" del tenant y el
+# formato por defecto solo completan lo que la tienda no devolvió
+def _locale_for(tenant_config, settings):
+    locale = {**DEFAULT_LOCALE, **tenant_config.get("locale", {})}
+    settings = settings or {}
+    for setting, key in _SETTING_KEYS.items():
+        if settings.get(setting) not in (None, ""):
+            locale[key] = settings[setting]
+    return locale
+
+
+# Formateador del tenant; se reconstruye solo cuando cambian los ajustes de la tienda en caché
+def formatter_for(tenant_config):
+    store_url = tenant_config["store_credentials"]['store_url']
+    settings = woocommerce_logic.get_store_settings(store_url)
+    cache_key = (woocommerce_logic.store_key(store_url), id(tenant_config))
+    cached = _formatters.get(cache_key)
+    if cached is not None and cached[0] is settings:
+        return cached[1]
+    try:
+        formatter = Formatter(_locale_for(tenant_config, settings), tenant_config.get("order_statuses"))
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error(f"Error en el formato de la tienda {store_url}: {e}")
+        formatter = Formatter(DEFAULT_LOCALE, tenant_config.get("order_statuses"))
+    with _lock:
+        _formatters[cache_key] = (settings, formatter)
+    return formatter
+
+
+# Precalcular los formateadores de todos los tenants (al terminar el warm-up)
+def build_all(tenants):
+    for tenant_config in tenants.values():
+        formatter_for(tenant_config)
@@ -0,0 +1,128 @@
+import logging
+import os
+import threading
+
+import cache
+
+MB = 1024 * 1024
+
+# Presupuesto total de las cachés y por grupo (tienda o tenant)
+GLOBAL_BUDGET = int(float(os.getenv("MEMORY_GLOBAL_BUDGET_MB", 512)) * MB)
+BUCKET_BUDGET = int(float(os.getenv("MEMORY_BUCKET_BUDGET_MB", 128)) * MB)
+# Al superar un presupuesto se desaloja hasta bajar a esta fracción, para no desalojar en cada escritura
+EVICTION_TARGET = float(os.getenv("MEMORY_EVICTION_TARGET", 0.9))
+# Memoria estimada de las peticiones en curso a partir de la cual se responde 503
+INFLIGHT_BUDGET = int(float(os.getenv("MEMORY_INFLIGHT_BUDGET_MB", 256)) * MB)
+# Memoria base estimada por petición (mensajes para OpenAI, respuesta, historial)
+REQUEST_BASE_BYTES = int(os.getenv("MEMORY_REQUEST_BASE_KB", 256)) * 1024
+# El cuerpo JSON ocupa varias veces su tamaño una vez parseado
+REQUEST_BODY_FACTOR = int(os.getenv("MEMORY_REQUEST_BODY_FACTOR", 6))
+# Límite opcional de RSS del proceso (0 lo desactiva)
+RSS_LIMIT = int(float(os.getenv("MEMORY_RSS_LIMIT_MB", 0)) * MB)
+# Segundos sugeridos en Retry-After cuando se rechaza una petición
+RETRY_AFTER = int(os.getenv("MEMORY_RETRY_AFTER", 2))
+
+_evict_lock = threading.Lock()
+_inflight_lock = threading.Lock()
+_inflight_bytes = 0
+_stats = {"evictions": 0, "evicted_bytes": 0, "rejected": 0}
+
+
+def total_bytes():
+    return sum(item.bytes for item in cache.registry)
+
+
+def bucket_bytes(bucket):
+    return sum(item.bucket_bytes.get(bucket, 0) for item in cache.registry)
+
+
+# Desalojar la entrada más antigua entre todas las cachés (opcionalmente de un grupo)
+def _evict_oldest(bucket=None):
+    candidates = []
+    for item in cache.registry:
+        oldest = item.oldest(bucket)
+        if oldest is not None:
+            candidates.append((oldest[0], item, oldest[1]))
+    if not candidates:
+        return False
+    _, item, key = min(candidates, key=lambda candidate: candidate[0])
+    before = item.bytes
+    item.delete(key)
+    _stats["evictions"] += 1
+    _stats["evicted_bytes"] += before - item.bytes
+    return True
+
+
+# Hacer cumplir los presupuestos tras una escritura en caché
+def enforce(changed_cache=None, bucket=None):
+    if total_bytes() <= GLOBAL_BUDGET and (bucket is None or bucket_bytes(bucket) <= BUCKET_BUDGET):
+        return
+    with _evict_lock:
+        if total_bytes() > GLOBAL_BUDGET:
+            for item in cache.registry:
+                item.purge_expired()
+            while total_bytes() > GLOBAL_BUDGET * EVICTION_TARGET and _evict_oldest():
+                pass
+        if bucket is not None and bucket_bytes(bucket) > BUCKET_BUDGET:
+            while bucket_bytes(bucket) > BUCKET_BUDGET * EVICTION_TARGET and _evict_oldest(bucket):
+                pass
+
+
+cache.on_grow = enforce
+
+
+# RSS actual del proceso en bytes (solo Linux; 0 si no se puede leer)
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+# Reservar memoria para una petición; devuelve los bytes reservados o None si hay que rechazarla
+def admit(content_length):
+    global _inflight_bytes
+    estimate = REQUEST_BASE_BYTES + REQUEST_BODY_FACTOR * (content_length or 0)
+
+    if RSS_LIMIT and rss_bytes() > RSS_LIMIT:
+        # Antes de rechazar, liberar la mitad del presupuesto de caché
+        with _evict_lock:
+            while total_bytes() > GLOBAL_BUDGET / 2 and _evict_oldest():
+                pass
+        if rss_bytes() > RSS_LIMIT:
+            _stats["rejected"] += 1
+            logging.error("Petición rechazada: el proceso supera MEMORY_RSS_LIMIT_MB")
+            return None
+
+    with _inflight_lock:
+        if _inflight_bytes and _inflight_bytes + estimate > INFLIGHT_BUDGET:
+            _stats["rejected"] += 1
+            return None
+        _inflight_bytes += estimate
+    return estimate
+
+
+def release(reserved):
+    global _inflight_bytes
+    with _inflight_lock:
+        _inflight_bytes -= reserved
+
+
+# Uso de memoria para el endpoint de administración
+def usage():
+    buckets = {}
+    for item in cache.registry:
+        for bucket, size in item.bucket_bytes.items():
+            buckets[bucket] = buckets.get(bucket, 0) + size
+    return {
+        "global_bytes": total_bytes(),
+        "global_budget": GLOBAL_BUDGET,
+        "bucket_budget": BUCKET_BUDGET,
+        "caches": {item.name: {"entries": len(item), "bytes": item.bytes} for item in cache.registry},
+        "buckets": buckets,
+        "inflight_bytes": _inflight_bytes,
+        "inflight_budget": INFLIGHT_BUDGET,
+        "rss_bytes": rss_bytes(),
+        **_stats,
+    }
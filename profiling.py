@@ -0,0 +1,175 @@
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Directorio donde se escriben los perfiles (formato "folded", compatible con flamegraph.pl y speedscope)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Profundidad de pila que guarda tracemalloc
+TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", 25))
+
+# Configuración activa, modificable en caliente desde el endpoint de administración
+config = {
+    "enabled": False,
+    "routes": [],          # rutas a perfilar; ["*"] para todas
+    "sample_rate": 1.0,    # fracción de peticiones de esas rutas
+    "cpu": True,           # muestreo de pilas
+    "memory": False,       # snapshots de tracemalloc
+    "interval_ms": 5,
+    "until": None,         # se desactiva solo pasado este instante (time.time())
+}
+_config_lock = threading.Lock()
+_stats = {"profiled": 0, "last_files": []}
+
+
+def _number(changes, key):
+    value = changes[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{key} must be a number")
+    return float(value)
+
+
+# Validar los cambios recibidos; lanza ValueError con el campo incorrecto
+def _validate(changes):
+    if not isinstance(changes, dict):
+        raise ValueError("configuration must be a JSON object")
+    for key in ("enabled", "cpu", "memory"):
+        if key in changes and not isinstance(changes[key], bool):
+            raise ValueError(f"{key} must be a boolean")
+    if "routes" in changes and not (isinstance(changes["routes"], list) and all(isinstance(route, str) for route in changes["routes"])):
+        raise ValueError("routes must be a list of paths")
+    if "sample_rate" in changes and not 0 < _number(changes, "sample_rate") <= 1:
+        raise ValueError("sample_rate must be in (0, 1]")
+    if "interval_ms" in changes and _number(changes, "interval_ms") < 1:
+        raise ValueError("interval_ms must be at least 1")
+    if changes.get("duration_s") is not None and _number(changes, "duration_s") < 0:
+        raise ValueError("duration_s must be positive")
+
+
+# Aplicar una nueva configuración; duration_s limita cuánto tiempo queda activa (null o 0 quita el límite).
+# Sin duration_s se conserva el límite vigente. Lanza ValueError si algún valor no es válido.
+def configure(changes):
+    _validate(changes)
+    with _config_lock:
+        for key in ("enabled", "routes", "sample_rate", "cpu", "memory", "interval_ms"):
+            if key in changes:
+                config[key] = changes[key]
+        if "duration_s" in changes:
+            duration = changes["duration_s"]
+            config["until"] = time.time() + float(duration) if duration else None
+
+        if config["enabled"] and config["memory"] and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        elif (not config["enabled"] or not config["memory"]) and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return status()
+
+
+def status():
+    return {**config, "tracemalloc": tracemalloc.is_tracing(), **_stats}
+
+
+def _should_profile(path):
+    if not config["enabled"]:
+        return False
+    if config["until"] is not None and time.time() > config["until"]:
+        configure({"enabled": False, "duration_s": None})
+        return False
+    routes = config["routes"]
+    if "*" not in routes and path not in routes:
+        return False
+    return random.random() < config["sample_rate"]
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# Muestreador de pilas de un hilo: acumula pilas "plegadas" (raíz;...;hoja)
+class StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+
+# Snapshot de tracemalloc sin las asignaciones del propio muestreador
+def _take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, __file__)])
+
+
+# Estado de perfilado de una petición, o None si no se muestrea
+def start_request(path):
+    if not _should_profile(path):
+        return None
+    profile = {"path": path, "started_at": time.time(), "sampler": None, "snapshot": None}
+    if config["cpu"]:
+        profile["sampler"] = StackSampler(threading.get_ident(), config["interval_ms"] / 1000.0)
+        profile["sampler"].start()
+    if config["memory"] and tracemalloc.is_tracing():
+        # El diff incluye lo asignado por otros hilos durante la petición
+        profile["snapshot"] = _take_snapshot()
+    return profile
+
+
+def _write_folded(path, counter):
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, value in counter.most_common():
+            f.write(f"{stack} {value}\n")
+
+
+# Cerrar el perfilado de la petición y escribir los archivos a disco
+def finish_request(profile):
+    if profile is None:
+        return []
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    route = profile["path"].strip("/").replace("/", "_") or "root"
+    base = os.path.join(PROFILE_DIR, f"{int(profile['started_at'] * 1000)}_{route}_{threading.get_ident()}")
+    files = []
+
+    if profile["sampler"] is not None:
+        profile["sampler"].stop()
+        if profile["sampler"].samples:
+            _write_folded(f"{base}.cpu.folded", profile["sampler"].samples)
+            files.append(f"{base}.cpu.folded")
+
+    if profile["snapshot"] is not None and tracemalloc.is_tracing():
+        allocations = Counter()
+        diff = _take_snapshot().compare_to(profile["snapshot"], "traceback")
+        for stat in diff:
+            if stat.size_diff <= 0:
+                continue
+            stack = ";".join(
+                f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback
+            )
+            allocations[stack] += stat.size_diff
+        if allocations:
+            _write_folded(f"{base}.mem.folded", allocations)
+            files.append(f"{base}.mem.folded")
+
+    _stats["profiled"] += 1
+    _stats["last_files"] = files
+    return files
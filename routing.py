@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import re
+import threading
+from logging.handlers import RotatingFileHandler
+
+# Desactivar el enrutamiento deja todos los turnos en la política "standard"
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "1") == "1"
+
+# Políticas por defecto: modelo, tope de tokens de salida y esfuerzo de razonamiento
+POLICIES = {
+    "light": {
+        "model": os.getenv("ROUTING_LIGHT_MODEL", "gpt-5-nano"),
+        "max_completion_tokens": 300,
+        "reasoning_effort": "minimal",
+    },
+    "standard": {
+        "model": "gpt-5-mini",
+        "max_completion_tokens": 600,
+        "reasoning_effort": "minimal",
+    },
+    # Los pedidos generan un JSON largo con billing, shipping y line_items
+    "order": {
+        "model": "gpt-5-mini",
+        "max_completion_tokens": 900,
+        "reasoning_effort": "minimal",
+    },
+    "complex": {
+        "model": "gpt-5-mini",
+        "max_completion_tokens": 900,
+        "reasoning_effort": "low",
+    },
+}
+
+# Saludos, agradecimientos y confirmaciones cortas
+_TRIVIAL_RE = re.compile(
+    r"^\W*(hola|holi|buen[oa]s?( d[ií]as| tardes| noches)?|hey|gracias|muchas gracias|ok|okay|vale|listo|"
+    r"perfecto|genial|dale|s[ií]|no|bien|chao|adi[oó]s|👍|🙏|😊)\W*$",
+    re.IGNORECASE,
+)
+# Intención de compra o de consultar un pedido
+_ORDER_RE = re.compile(
+    r"pedido|comprar|compra|orden|direcci[oó]n|env[ií]o|pagar|pago|contra ?entrega|quiero (el|la|uno|una|\d)",
+    re.IGNORECASE,
+)
+
+# Registro de resultados (una línea JSON por turno) para ajustar la política
+_outcome_logger = logging.getLogger("routing_outcomes")
+_outcome_logger.setLevel(logging.INFO)
+_outcome_logger.propagate = False
+_outcome_handler = RotatingFileHandler(
+    os.getenv("ROUTING_OUTCOMES_LOG", "routing_outcomes.log"), maxBytes=1000000, backupCount=5
+)
+_outcome_handler.setFormatter(logging.Formatter("%(message)s"))
+_outcome_logger.addHandler(_outcome_handler)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+# Estimación barata de complejidad: 0 trivial, 1 normal, 2 compleja
+def estimate_complexity(query):
+    text = query.strip()
+    if len(text) <= 40 and _TRIVIAL_RE.match(text):
+        return 0
+    if len(text) > 300 or text.count("?") >= 2 or text.count("\n") >= 2:
+        return 2
+    return 1
+
+
+# Etapa de la conversación según el historial y el mensaje actual. Solo cuentan los mensajes
+# del cliente y las acciones place_order: los textos fijos del bot (pie de la búsqueda,
+# estado del pedido) también mencionan pedidos.
+def conversation_stage(history, query):
+    if len(history) <= 1:
+        return "greeting"
+    if _ORDER_RE.search(query):
+        return "order"
+    for turn in history.recent(3):
+        if turn.role == "user" and _ORDER_RE.search(turn.content):
+            return "order"
+        if turn.role == "assistant" and "[ACTION](place_order)" in turn.content:
+            return "order"
+    return "browsing"
+
+
+# Parámetros de una política, con los cambios del tenant en "routing.policies"
+def policy(tenant_config, name):
+    policies = {**POLICIES, **tenant_config.get("routing", {}).get("policies", {})}
+    return dict(policies[name])
+
+
+# Elegir la política del turno; devuelve (nombre, parámetros para la API de OpenAI)
+def choose_route(tenant_config, history, query):
+    routing_config = tenant_config.get("routing", {})
+
+    if not ROUTING_ENABLED or not routing_config.get("enabled", True):
+        name = "standard"
+    else:
+        complexity = estimate_complexity(query)
+        stage = conversation_stage(history, query)
+        if stage == "order":
+            name = "order"
+        elif complexity == 0:
+            name = "light"
+        elif complexity == 2:
+            name = "complex"
+        else:
+            name = "standard"
+
+    return name, policy(tenant_config, name)
+
+
+# Registrar el resultado de un turno (latencia, tokens y éxito de la acción)
+def record_outcome(tenant, route_name, model, latency, usage=None, action=None, action_ok=None, error=False):
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+
+    with _stats_lock:
+        stats = _stats.setdefault((tenant, route_name), {
+            "turns": 0,
+            "errors": 0,
+            "latency_total": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "actions": 0,
+            "action_failures": 0,
+        })
+        stats["turns"] += 1
+        stats["errors"] += int(error)
+        stats["latency_total"] += latency
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        if action:
+            stats["actions"] += 1
+            stats["action_failures"] += int(not action_ok)
+
+    _outcome_logger.info(json.dumps({
+        "tenant": tenant,
+        "route": route_name,
+        "model": model,
+        "latency": round(latency, 3),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "action": action,
+        "action_ok": action_ok,
+        "error": error,
+    }))
+
+
+# Resumen por tenant y política para el endpoint de administración
+def routing_stats():
+    with _stats_lock:
+        return [
+            {
+                "tenant": tenant,
+                "route": route_name,
+                **stats,
+                "latency_avg": round(stats["latency_total"] / stats["turns"], 3) if stats["turns"] else 0,
+            }
+            for (tenant, route_name), stats in _stats.items()
+        ]
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+
+# orjson es opcional; si no está instalado se usa json de la biblioteca estándar
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# Backends disponibles: nombre -> (loads(bytes), dumps(obj) -> bytes)
+BACKENDS = {"json": (json.loads, _json_dumps)}
+if orjson is not None:
+    BACKENDS["orjson"] = (orjson.loads, orjson.dumps)
+
+loads = None
+dumps = None
+backend = None
+
+
+# Registrar otro backend (p. ej. ujson o msgspec) con las mismas firmas
+def register_backend(name, loads_fn, dumps_fn):
+    BACKENDS[name] = (loads_fn, dumps_fn)
+
+
+# Cambiar el backend activo; por defecto el más rápido disponible
+def use(name=None):
+    global loads, dumps, backend
+    if name is None:
+        name = "orjson" if "orjson" in BACKENDS else "json"
+    if name not in BACKENDS:
+        logging.error(f"Backend de serialización desconocido: {name}; se usa json")
+        name = "json"
+    backend = name
+    loads, dumps = BACKENDS[name]
+
+
+use(os.getenv("SERIALIZATION_BACKEND") or None)
+
+
+# Campos de una petición de Dialogflow que usa el webhook
+class TurnRequest:
+    __slots__ = ("query", "session", "response_id", "history")
+
+    def __init__(self, query, session, response_id, history):
+        self.query = query
+        self.session = session
+        self.response_id = response_id
+        self.history = history
+
+
+# Extraer de la petición solo texto, sesión, responseId y el contexto de historial.
+# Devuelve None si el cuerpo no es JSON válido o no trae queryResult.
+def parse_turn_request(body):
+    try:
+        req = loads(body)
+    except ValueError:
+        return None
+    if not isinstance(req, dict):
+        return None
+    query_result = req.get("queryResult")
+    if not isinstance(query_result, dict):
+        return None
+
+    history = None
+    for context in query_result.get("outputContexts") or ():
+        if "conversation_history" in context.get("name", ""):
+            history = (context.get("parameters") or {}).get("history")
+            break
+    return TurnRequest(
+        query_result.get("queryText", ""),
+        req.get("session", ""),
+        req.get("responseId", ""),
+        history,
+    )
+
+
+# Un valor se puede copiar tal cual entre comillas si no requiere escapes JSON
+def _is_plain(value):
+    return value.isascii() and value.isprintable() and '"' not in value and "\\" not in value
+
+
+_CONTEXT_KEYS = {"name", "lifespanCount", "parameters"}
+
+
+# Contexto de salida con el historial compacto: el historial (ya codificado en
+# History.to_context) se copia sin pasar por el serializador
+def _dump_context(context):
+    if not isinstance(context, dict) or context.keys() != _CONTEXT_KEYS:
+        return dumps(context)
+    parameters = context["parameters"]
+    history = parameters.get("history") if isinstance(parameters, dict) and len(parameters) == 1 else None
+    if not isinstance(history, str) or not _is_plain(history):
+        return dumps(context)
+    return b"".join((
+        b'{"name":', dumps(context["name"]),
+        b',"lifespanCount":', dumps(context["lifespanCount"]),
+        b',"parameters":{"history":"', history.encode("ascii"), b'"}}',
+    ))
+
+
+# Serializar una respuesta; los outputContexts se escriben desde sus partes precalculadas
+def dumps_response(payload):
+    contexts = payload.get("outputContexts") if isinstance(payload, dict) else None
+    if not isinstance(contexts, list):
+        return dumps(payload)
+    parts = []
+    for key, value in payload.items():
+        if key == "outputContexts":
+            value = b"[" + b",".join(_dump_context(context) for context in contexts) + b"]"
+        else:
+            value = dumps(value)
+        parts.append(dumps(key) + b":" + value)
+    return b"{" + b",".join(parts) + b"}"
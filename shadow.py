@@ -0,0 +1,205 @@
+import difflib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+import accounting
+
+# Fracción de turnos que se repiten contra las variantes (0 desactiva el modo sombra)
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", 0))
+# Base de datos local con los resultados
+SHADOW_DB_PATH = os.getenv("SHADOW_DB_PATH", "shadow.db")
+SHADOW_WORKERS = int(os.getenv("SHADOW_WORKERS", 2))
+# Turnos en cola como máximo; si se supera, las muestras nuevas se descartan
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", 50))
+# Variantes globales en JSON, p. ej. [{"name": "nano", "model": "gpt-5-nano"}];
+# cada tenant puede definir las suyas con "shadow_variants" en TENANTS
+SHADOW_VARIANTS = json.loads(os.getenv("SHADOW_VARIANTS", "[]"))
+
+_ACTION_RE = re.compile(r"\[ACTION\]\((\w+)\)\s*(\{.*\})", re.DOTALL)
+
+_executor = ThreadPoolExecutor(max_workers=SHADOW_WORKERS, thread_name_prefix="shadow")
+_pending = 0
+_pending_lock = threading.Lock()
+_db_lock = threading.Lock()
+_db = None
+
+
+def _connection():
+    global _db
+    if _db is None:
+        _db = sqlite3.connect(SHADOW_DB_PATH, check_same_thread=False)
+        _db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS shadow_runs (
+                created_at REAL,
+                tenant TEXT,
+                variant TEXT,
+                primary_model TEXT,
+                primary_latency REAL,
+                primary_prompt_tokens INTEGER,
+                primary_completion_tokens INTEGER,
+                primary_action TEXT,
+                variant_model TEXT,
+                variant_latency REAL,
+                variant_prompt_tokens INTEGER,
+                variant_completion_tokens INTEGER,
+                variant_action TEXT,
+                action_parse_ok INTEGER,
+                divergence REAL,
+                error TEXT
+            )
+            """
+        )
+    return _db
+
+
+# Nombre de la acción y si sus parámetros son JSON válido: (None, None) si no hay acción
+def parse_action(text):
+    if "[ACTION]" not in text:
+        return None, None
+    match = _ACTION_RE.search(text)
+    if not match:
+        return "unknown", False
+    try:
+        json.loads(match.group(2))
+        return match.group(1), True
+    except ValueError:
+        return match.group(1), False
+
+
+def _variants_for(tenant_config):
+    return tenant_config.get("shadow_variants", SHADOW_VARIANTS)
+
+
+def _run_variant(tenant, variant, messages, primary):
+    messages = list(messages)
+    if variant.get("prompt"):
+        messages[0] = {"role": "system", "content": variant["prompt"]}
+    params = {
+        "model": variant.get("model", primary["model"]),
+        "max_completion_tokens": variant.get("max_completion_tokens", primary["max_completion_tokens"]),
+        "reasoning_effort": variant.get("reasoning_effort", primary["reasoning_effort"]),
+    }
+
+    variant_name = variant.get("name", params["model"])
+    started_at = time.monotonic()
+    text, usage, error = "", None, None
+    try:
+        response = openai.chat.completions.create(messages=messages, **params)
+        text = (response.choices[0].message.content or "").strip()
+        usage = response.usage
+        # Las repeticiones son llamadas reales: cuentan en el consumo del tenant con su propia ruta
+        accounting.record_openai(usage, time.monotonic() - started_at, scope=(tenant, f"shadow:{variant_name}"))
+    except Exception as e:
+        error = str(e)
+    latency = time.monotonic() - started_at
+
+    action, action_ok = parse_action(text)
+    divergence = 1.0 - difflib.SequenceMatcher(None, primary["text"], text).ratio()
+    row = (
+        time.time(),
+        tenant,
+        variant_name,
+        primary["model"],
+        primary["latency"],
+        getattr(primary["usage"], "prompt_tokens", None),
+        getattr(primary["usage"], "completion_tokens", None),
+        primary["action"],
+        params["model"],
+        latency,
+        getattr(usage, "prompt_tokens", None),
+        getattr(usage, "completion_tokens", None),
+        action,
+        None if action_ok is None else int(action_ok),
+        divergence,
+        error,
+    )
+    with _db_lock:
+        db = _connection()
+        db.execute("INSERT INTO shadow_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+        db.commit()
+
+
+def _replay(tenant, variants, messages, primary):
+    global _pending
+    try:
+        for variant in variants:
+            try:
+                _run_variant(tenant, variant, messages, primary)
+            except Exception as e:
+                logging.error(f"Error en el turno sombra de {tenant}: {e}")
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+# Repetir en segundo plano una muestra de los turnos contra las variantes configuradas.
+# primary: model, max_completion_tokens, reasoning_effort, latency, usage, text y action del turno real.
+def maybe_shadow(tenant, tenant_config, messages, primary):
+    global _pending
+    variants = _variants_for(tenant_config)
+    if not variants or SHADOW_SAMPLE_RATE <= 0 or random.random() >= SHADOW_SAMPLE_RATE:
+        return False
+    with _pending_lock:
+        if _pending >= SHADOW_MAX_PENDING:
+            return False
+        _pending += 1
+    _executor.submit(_replay, tenant, variants, messages, primary)
+    return True
+
+
+# Comparación de variantes por tenant
+def report(tenant=None):
+    query = """
+        SELECT tenant, variant, COUNT(*),
+               AVG(primary_latency), AVG(variant_latency),
+               AVG(primary_prompt_tokens), AVG(variant_prompt_tokens),
+               AVG(primary_completion_tokens), AVG(variant_completion_tokens),
+               AVG(action_parse_ok),
+               AVG(CASE WHEN COALESCE(primary_action, '') = COALESCE(variant_action, '') THEN 1.0 ELSE 0.0 END),
+               AVG(divergence),
+               SUM(CASE WHEN error IS NOT NULL THEN 1 ELSE 0 END)
+        FROM shadow_runs
+    """
+    params = ()
+    if tenant:
+        query += " WHERE tenant = ?"
+        params = (tenant,)
+    query += " GROUP BY tenant, variant ORDER BY tenant, variant"
+
+    columns = (
+        "tenant", "variant", "samples",
+        "primary_latency_avg", "variant_latency_avg",
+        "primary_prompt_tokens_avg", "variant_prompt_tokens_avg",
+        "primary_completion_tokens_avg", "variant_completion_tokens_avg",
+        "action_parse_ok_rate", "action_agreement_rate", "divergence_avg", "errors",
+    )
+    with _db_lock:
+        rows = _connection().execute(query, params).fetchall()
+    return [
+        {column: round(value, 3) if isinstance(value, float) else value for column, value in zip(columns, row)}
+        for row in rows
+    ]
+
+
+# Uso: python shadow.py [tenant]
+if __name__ == "__main__":
+    tenant_filter = sys.argv[1] if len(sys.argv) > 1 else None
+    for entry in report(tenant_filter):
+        print(
+            f"{entry['tenant']:<20} {entry['variant']:<16} n={entry['samples']:<5} "
+            f"latencia {entry['primary_latency_avg']}s -> {entry['variant_latency_avg']}s  "
+            f"tokens salida {entry['primary_completion_tokens_avg']} -> {entry['variant_completion_tokens_avg']}  "
+            f"acción ok {entry['action_parse_ok_rate']}  acuerdo {entry['action_agreement_rate']}  "
+            f"divergencia {entry['divergence_avg']}  errores {entry['errors']}"
+        )
@@ -0,0 +1,93 @@
+import json
+import types
+
+import openai
+import pytest
+
+import cassettes
+import catalog_feed
+import coalescing
+import lifecycle
+import woocommerce_logic
+
+
+def _completion(text):
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 1,
+        "model": "gpt-5-mini",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+    }
+
+
+def test_replay_ignores_catalog_facts_message(monkeypatch, tmp_path):
+    monkeypatch.setattr(cassettes, "CASSETTE_DIR", str(tmp_path))
+    with cassettes.use_cassette("facts", "record"):
+        real_chat = types.SimpleNamespace(completions=types.SimpleNamespace(
+            create=lambda **params: cassettes.ChatCompletion.model_validate(_completion("Hola!"))
+        ))
+        monkeypatch.setattr(openai.chat.completions, "_original_chat", real_chat)
+        openai.chat.completions.create(model="gpt-5-mini", messages=[
+            {"role": "system", "content": "Prompt"},
+            {"role": "system", "content": f"{catalog_feed.FACTS_HEADER} (v3-abc). Producto X"},
+            {"role": "user", "content": "hola"},
+        ])
+
+    with cassettes.use_cassette("facts", "replay") as cassette:
+        response = openai.chat.completions.create(model="gpt-5-mini", messages=[
+            {"role": "system", "content": "Prompt"},
+            {"role": "user", "content": "hola"},
+        ])
+    assert response.choices[0].message.content == "Hola!"
+    assert cassette.stats["misses"] == 0
+
+
+class _Response:
+    status_code = 201
+    text = ""
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"id": 77, "status": "processing"}
+
+
+def _webhook_body(response_id):
+    return json.dumps({
+        "responseId": response_id,
+        "session": "projects/tienda/agent/sessions/cassette-orden",
+        "queryResult": {"queryText": "confirmo el pedido", "outputContexts": []},
+    }).encode("utf-8")
+
+
+def test_place_order_turn_replays_without_touching_pending_orders(monkeypatch, tmp_path):
+    import app as app_module
+
+    pending_path = tmp_path / "pending_orders.json"
+    monkeypatch.setattr(cassettes, "CASSETTE_DIR", str(tmp_path))
+    monkeypatch.setattr(lifecycle, "PENDING_ORDERS_PATH", str(pending_path))
+    monkeypatch.setattr(coalescing, "DEBOUNCE_SECONDS", 0)
+    posted = []
+    store = types.SimpleNamespace(post=lambda endpoint, data: posted.append(data) or _Response())
+    monkeypatch.setattr(woocommerce_logic, "get_wcapi", lambda *args: store)
+    action = '[ACTION](place_order) {"billing": {"first_name": "Ana"}, "line_items": [{"product_id": 5, "quantity": 1}]}'
+
+    with cassettes.use_cassette("orden", "record", modules=(app_module,)):
+        real_chat = types.SimpleNamespace(completions=types.SimpleNamespace(
+            create=lambda **params: cassettes.ChatCompletion.model_validate(_completion(action))
+        ))
+        monkeypatch.setattr(openai.chat.completions, "_original_chat", real_chat)
+        assert app_module.app.test_client().post("/llm-integration/econi", data=_webhook_body("orden-1")).status_code == 200
+        assert lifecycle.wait_idle(5)
+    assert len(posted) == 1 and json.loads(pending_path.read_text()) == {}
+
+    # En replay no se llama a la tienda ni se escribe en los pendientes reales
+    coalescing.responses.clear()
+    monkeypatch.setattr(woocommerce_logic, "get_wcapi", lambda *args: pytest.fail("replay called the store"))
+    pending_path.unlink()
+    report, stats = cassettes.run("orden", app_module)
+    assert stats["misses"] == 0 and stats["replayed"] >= 2
+    assert not pending_path.exists()
@@ -0,0 +1,35 @@
+import catalog_feed
+import woocommerce_logic
+
+STORE_URL = "https://tienda.test"
+
+
+def _tenant(**extra):
+    return {"store_credentials": {"store_url": STORE_URL}, "catalog_facts": True, **extra}
+
+
+def _load_catalog(size):
+    catalog = [
+        {"id": index, "name": f"Producto {index}", "price": "1000", "stock_status": "instock", "total_sales": index}
+        for index in range(1, size + 1)
+    ]
+    woocommerce_logic.catalog_cache.set(f"{STORE_URL}|catalog", catalog)
+
+
+def test_build_facts_limits_top_sellers():
+    _load_catalog(100)
+    facts = catalog_feed.build_facts(_tenant(featured_products=[1]))
+    lines = facts.splitlines()
+    assert len(lines) == 1 + catalog_feed.FACTS_TOP_SELLERS
+    assert lines[0].startswith("- Producto 1 ")
+    assert lines[1].startswith("- Producto 100 ")
+
+
+def test_refresh_facts_requires_opt_in():
+    _load_catalog(5)
+    catalog_feed.prompt_facts.pop("sin_facts", None)
+    catalog_feed.refresh_facts("sin_facts", {"store_credentials": {"store_url": STORE_URL}})
+    assert catalog_feed.facts_message("sin_facts") is None
+
+    catalog_feed.refresh_facts("con_facts", _tenant())
+    assert "Producto 5" in catalog_feed.facts_message("con_facts")["content"]
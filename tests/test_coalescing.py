@@ -0,0 +1,58 @@
+import threading
+import time
+
+import coalescing
+
+
+def _submit_later(results, session_id, response_id, query, delay):
+    def run():
+        time.sleep(delay)
+        results[response_id] = coalescing.submit(session_id, response_id, query, lambda text: {"fulfillmentText": text})
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_single_message_is_not_debounced():
+    started_at = time.monotonic()
+    payload = coalescing.submit("econi|solo", "r-solo", "hola", lambda text: {"fulfillmentText": text})
+    assert payload == {"fulfillmentText": "hola"}
+    assert time.monotonic() - started_at < coalescing.DEBOUNCE_SECONDS / 2
+
+
+def test_same_session_in_different_tenants_is_not_merged():
+    results = {}
+    threads = [
+        _submit_later(results, "econi|573001234567", "r-econi", "hola econi", 0),
+        _submit_later(results, "relojeria|573001234567", "r-relojeria", "hola relojeria", 0.05),
+    ]
+    for thread in threads:
+        thread.join()
+    assert results["r-econi"] == {"fulfillmentText": "hola econi"}
+    assert results["r-relojeria"] == {"fulfillmentText": "hola relojeria"}
+
+
+def test_burst_in_same_session_is_merged():
+    results = {}
+    calls = []
+
+    def process(text):
+        calls.append(text)
+        time.sleep(0.1)
+        return {"fulfillmentText": text}
+
+    first = threading.Thread(target=lambda: results.update(a=coalescing.submit("econi|rafaga", "r-a", "uno", process)))
+    first.start()
+    time.sleep(0.02)
+    threads = []
+    for response_id, query in (("r-b", "dos"), ("r-c", "tres")):
+        thread = threading.Thread(target=lambda r=response_id, q=query: results.update({r: coalescing.submit("econi|rafaga", r, q, process)}))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    for thread in [first, *threads]:
+        thread.join()
+
+    assert calls == ["uno", "dos\ntres"]
+    assert results["r-b"]["fulfillmentMessages"] == [{"payload": {"coalesced": True}}]
+    assert results["r-c"] == {"fulfillmentText": "dos\ntres"}
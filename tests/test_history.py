@@ -0,0 +1,53 @@
+import base64
+import json
+import zlib
+
+import history
+from history import History, load_history
+
+
+def _conversation(turns):
+    conversation = History()
+    for index in range(turns):
+        conversation.append("user" if index % 2 == 0 else "assistant", f"mensaje {index}")
+    return conversation
+
+
+def test_context_round_trip_keeps_turns_and_counter():
+    original = _conversation(history.HOT_TURNS + history.ARCHIVE_BATCH + 5)
+    original.trim(8)
+    decoded = History.from_context(original.to_context())
+    assert decoded.to_messages() == original.to_messages()
+    assert (decoded.conversation, decoded.turn) == (original.conversation, original.turn)
+
+
+def test_legacy_context_is_still_read():
+    pairs = [[1, "hola"], [2, "buenas"]]
+    legacy = "zl1:" + base64.b64encode(zlib.compress(json.dumps(pairs).encode("utf-8"))).decode("ascii")
+    decoded = History.from_context(legacy)
+    assert decoded.to_messages() == [{"role": "user", "content": "hola"}, {"role": "assistant", "content": "buenas"}]
+
+
+def test_stale_context_loses_to_memory_after_trim():
+    memory = _conversation(4)
+    stale = memory.to_context()
+    memory.append("user", "otro mensaje")
+    memory.append("assistant", "otra respuesta")
+    # Recortado a menos turnos que el contexto viejo: la longitud ya no sirve para compararlos
+    memory.trim(2)
+    history.sessions.set("t|stale", memory)
+    assert load_history("t|stale", stale) is memory
+
+
+def test_empty_context_starts_a_new_conversation():
+    memory = _conversation(4)
+    history.sessions.set("t|empty", memory)
+    loaded = load_history("t|empty", None)
+    assert len(loaded) == 0 and loaded.conversation != memory.conversation
+
+
+def test_context_from_another_conversation_wins_over_memory():
+    memory = _conversation(10)
+    history.sessions.set("t|other", memory)
+    new_context = _conversation(2).to_context()
+    assert load_history("t|other", new_context).to_context() == new_context
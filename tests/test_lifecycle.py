@@ -0,0 +1,72 @@
+import time
+
+import accounting
+import lifecycle
+
+
+def _wait_jobs():
+    assert lifecycle.wait_idle(5)
+
+
+def test_order_job_keeps_request_scope(tmp_path, monkeypatch):
+    monkeypatch.setattr(lifecycle, "PENDING_ORDERS_PATH", str(tmp_path / "pending.json"))
+    seen = []
+    token = accounting._scope.set(("econi", "/webhook"))
+    try:
+        lifecycle.submit_order({"store_url": "https://tienda.test"}, lambda job: seen.append(accounting._scope.get()) or True)
+    finally:
+        accounting._scope.reset(token)
+    _wait_jobs()
+    assert seen == [("econi", "/webhook")]
+
+
+def test_failed_job_stays_pending_and_replay_is_flagged(tmp_path, monkeypatch):
+    monkeypatch.setattr(lifecycle, "PENDING_ORDERS_PATH", str(tmp_path / "pending.json"))
+    job_id = lifecycle.submit_order({"store_url": "https://tienda.test"}, lambda job: False)
+    _wait_jobs()
+    assert job_id in lifecycle._read_pending()
+
+    replayed = []
+    assert lifecycle.replay_pending_orders(lambda job: replayed.append(job) or True) == 1
+    _wait_jobs()
+    assert replayed[0]["job_id"] == job_id and replayed[0]["replayed"]
+    assert lifecycle._read_pending() == {}
+
+
+def test_rejected_job_moves_to_dead_letter(tmp_path, monkeypatch):
+    monkeypatch.setattr(lifecycle, "PENDING_ORDERS_PATH", str(tmp_path / "pending.json"))
+    monkeypatch.setattr(lifecycle, "DEAD_ORDERS_PATH", str(tmp_path / "dead.json"))
+    job_id = lifecycle.submit_order({"store_url": "https://tienda.test"}, lambda job: lifecycle.REJECTED)
+    _wait_jobs()
+    assert lifecycle._read_pending() == {}
+    assert lifecycle._read_pending(lifecycle.DEAD_ORDERS_PATH)[job_id]["reason"] == lifecycle.REJECTED
+
+
+def test_replay_stops_after_max_attempts_and_age(tmp_path, monkeypatch):
+    monkeypatch.setattr(lifecycle, "PENDING_ORDERS_PATH", str(tmp_path / "pending.json"))
+    monkeypatch.setattr(lifecycle, "DEAD_ORDERS_PATH", str(tmp_path / "dead.json"))
+    now = time.time()
+    lifecycle._write_pending({
+        "agotado": {"job_id": "agotado", "accepted_at": now, "attempts": lifecycle.ORDER_MAX_ATTEMPTS},
+        "viejo": {"job_id": "viejo", "accepted_at": now - lifecycle.ORDER_MAX_AGE - 1, "attempts": 1},
+        "vigente": {"job_id": "vigente", "accepted_at": now, "attempts": 1},
+    })
+    assert lifecycle.replay_pending_orders(lambda job: False) == 1
+    _wait_jobs()
+    assert lifecycle._read_pending()["vigente"]["attempts"] == 2
+    dead = lifecycle._read_pending(lifecycle.DEAD_ORDERS_PATH)
+    assert (dead["agotado"]["reason"], dead["viejo"]["reason"]) == ("max_attempts", "expired")
+
+
+def test_process_order_marks_store_rejections_as_permanent(monkeypatch):
+    import app as app_module
+    import woocommerce_logic
+
+    def rejected(**kwargs):
+        raise woocommerce_logic.OrderRejected(400, "woocommerce_rest_invalid_product_id")
+
+    monkeypatch.setattr(app_module, "create_order", rejected)
+    job = {"job_id": "abc", "store_url": "https://econi.com.pe/", "accepted_at": time.time(), "order_data": {}}
+    assert app_module.process_order(job) == lifecycle.REJECTED
+    monkeypatch.setattr(app_module, "create_order", lambda **kwargs: None)
+    assert app_module.process_order(job) is False
@@ -0,0 +1,44 @@
+import locale_format
+import woocommerce_logic
+
+ECONI = {
+    "store_credentials": {"store_url": "https://econi.test/"},
+    "locale": {"currency": "PEN", "currency_position": "left_space", "thousand_separator": ",", "decimal_separator": ".", "decimals": 2},
+}
+
+
+def _settings(store_url, settings):
+    woocommerce_logic.settings_cache.set(f"{woocommerce_logic.store_key(store_url)}|settings", settings)
+
+
+def test_tenant_locale_is_only_a_fallback():
+    _settings("https://econi.test/", {})
+    assert locale_format.formatter_for(ECONI).price("1234.5") == "S/ 1,234.50"
+
+    _settings("https://econi.test/", {"woocommerce_currency": "USD", "woocommerce_currency_pos": "left"})
+    assert locale_format.formatter_for(ECONI).price("1234.5") == "$1,234.50"
+
+
+def test_colombian_store_format_and_statuses():
+    tenant = {"store_credentials": {"store_url": "https://co.test"}}
+    _settings("https://co.test", {
+        "woocommerce_currency": "COP",
+        "woocommerce_currency_pos": "left",
+        "woocommerce_price_thousand_sep": ".",
+        "woocommerce_price_decimal_sep": ",",
+        "woocommerce_price_num_decimals": "0",
+    })
+    formatter = locale_format.formatter_for(tenant)
+    assert formatter.price("89900") == "$89.900"
+    assert formatter.price(None) == "N/A"
+    assert formatter.order_status("processing") == "Pedido enviado a la transportadora"
+    assert formatter.line_item({"name": "Reloj", "quantity": 2, "total": "200000"}) == "Reloj: 2 x $100.000"
+    assert locale_format.formatter_for(tenant) is formatter
+
+
+def test_store_country_does_not_change_status_language():
+    tenant = {"store_credentials": {"store_url": "https://us.test"}, "order_statuses": {"completed": "Entregado"}}
+    _settings("https://us.test", {"woocommerce_currency": "USD", "woocommerce_default_country": "US:CA"})
+    formatter = locale_format.formatter_for(tenant)
+    assert formatter.order_status("completed") == "Entregado"
+    assert formatter.order_status("processing") == "Pedido enviado a la transportadora"
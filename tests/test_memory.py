@@ -0,0 +1,51 @@
+import cache
+import memory
+from cache import TTLCache
+
+
+def _isolated_cache(monkeypatch, name, **kwargs):
+    item = TTLCache(name, ttl=kwargs.pop("ttl", 60), maxsize=kwargs.pop("maxsize", 1000))
+    monkeypatch.setattr(cache, "registry", [item])
+    return item
+
+
+def test_maxsize_evicts_oldest_and_tracks_bytes(monkeypatch):
+    item = _isolated_cache(monkeypatch, "test_maxsize", maxsize=2)
+    item.set("a|1", "x" * 10)
+    item.set("a|2", "y" * 10)
+    item.set("b|3", "z" * 10)
+    assert item.get("a|1") is None and item.get("a|2") is not None
+    assert item.bytes == sum(item.bucket_bytes.values())
+    assert set(item.bucket_bytes) == {"a", "b"}
+
+
+def test_expired_entries_are_purged(monkeypatch):
+    item = _isolated_cache(monkeypatch, "test_expired")
+    item.set("a|1", "x" * 100, ttl=-1)
+    item.set("a|2", "y" * 100)
+    assert item.purge_expired() > 0
+    assert len(item) == 1 and item.get("a|2") is not None
+
+
+def test_bucket_budget_evicts_only_that_bucket(monkeypatch):
+    item = _isolated_cache(monkeypatch, "test_bucket")
+    item.set("otra|1", "o" * 100)
+    monkeypatch.setattr(memory, "BUCKET_BUDGET", 350)
+    for index in range(6):
+        item.set(f"tienda|{index}", "x" * 100)
+    assert memory.bucket_bytes("tienda") <= 350
+    assert item.get("tienda|5") is not None and item.get("tienda|0") is None
+    assert item.get("otra|1") is not None
+
+
+def test_global_budget_evicts_oldest_across_caches(monkeypatch):
+    first = _isolated_cache(monkeypatch, "test_global_a")
+    second = TTLCache("test_global_b", ttl=60, maxsize=1000)
+    monkeypatch.setattr(cache, "registry", [first, second])
+    monkeypatch.setattr(memory, "GLOBAL_BUDGET", 500)
+    first.set("a|viejo", "x" * 200)
+    second.set("b|medio", "y" * 200)
+    first.set("a|nuevo", "z" * 200)
+    assert memory.total_bytes() <= 500
+    assert first.get("a|viejo") is None
+    assert first.get("a|nuevo") is not None
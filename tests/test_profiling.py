@@ -0,0 +1,36 @@
+import pytest
+
+import profiling
+
+
+@pytest.fixture(autouse=True)
+def _restore_config():
+    saved = dict(profiling.config)
+    yield
+    profiling.config.clear()
+    profiling.config.update(saved)
+
+
+@pytest.mark.parametrize("changes", [
+    {"interval_ms": 0},
+    {"sample_rate": 0},
+    {"sample_rate": 1.5},
+    {"duration_s": "diez"},
+    {"routes": "/webhook"},
+    {"enabled": "true"},
+])
+def test_invalid_values_are_rejected(changes):
+    before = dict(profiling.config)
+    with pytest.raises(ValueError):
+        profiling.configure(changes)
+    assert profiling.config == before
+
+
+def test_deadline_is_kept_unless_duration_is_sent():
+    profiling.configure({"enabled": False, "duration_s": 60})
+    until = profiling.config["until"]
+    assert until is not None
+    profiling.configure({"sample_rate": 0.5})
+    assert profiling.config["until"] == until
+    profiling.configure({"duration_s": None})
+    assert profiling.config["until"] is None
@@ -0,0 +1,30 @@
+import routing
+from history import History
+
+SEARCH_REPLY = (
+    "🔍 **Resultado de la búsqueda:**\n\n**Reloj (ID: 1)**\n"
+    "Puedes realizar tu pedido en el enlace o yo puedo ayudarte por este medio.\n"
+)
+
+
+def _history(*turns):
+    return History(turns)
+
+
+def test_bot_texts_do_not_mark_the_order_stage():
+    history = _history(("user", "tienen relojes?"), ("assistant", "[ACTION](search_products) {}"), ("assistant", SEARCH_REPLY))
+    assert routing.conversation_stage(history, "gracias") == "browsing"
+    assert routing.choose_route({}, history, "gracias")[0] == "light"
+
+
+def test_user_text_and_place_order_mark_the_order_stage():
+    history = _history(("user", "quiero comprar el reloj"), ("assistant", "Claro, ¿a qué dirección?"))
+    assert routing.conversation_stage(history, "Calle 123") == "order"
+    history = _history(("user", "listo"), ("assistant", '[ACTION](place_order) {"line_items": []}'))
+    assert routing.conversation_stage(history, "gracias") == "order"
+
+
+def test_policy_applies_tenant_overrides():
+    tenant = {"routing": {"policies": {"standard": {"model": "otro", "max_completion_tokens": 100}}}}
+    assert routing.policy(tenant, "standard")["model"] == "otro"
+    assert routing.policy({}, "standard") == routing.POLICIES["standard"]
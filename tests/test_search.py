@@ -0,0 +1,69 @@
+import woocommerce_logic
+
+STORE_URL = "https://busqueda.test"
+
+
+class _Response:
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+class _API:
+    def __init__(self, data):
+        self.data = data
+        self.calls = []
+
+    def get(self, endpoint, params=None):
+        self.calls.append((endpoint, params))
+        return _Response(self.data)
+
+
+def _product(index, name):
+    return {"id": index, "name": name, "stock_status": "instock", "total_sales": 0}
+
+
+def test_search_falls_back_to_store_when_catalog_has_no_match(monkeypatch):
+    woocommerce_logic.catalog_cache.set(f"{STORE_URL}|catalog", [_product(1, "Ron añejo")])
+    api = _API([_product(2, "Botella especial")])
+    monkeypatch.setattr(woocommerce_logic, "get_wcapi", lambda *args: api)
+
+    products = woocommerce_logic.search_products(STORE_URL, "ck", "cs", "regalo")
+
+    assert [product["id"] for product in products] == [2]
+    assert api.calls and api.calls[0][0] == "products"
+
+
+def test_search_honours_limit_above_top_k(monkeypatch):
+    catalog = [_product(index, f"Vino tinto {index}") for index in range(1, 11)]
+    woocommerce_logic.catalog_cache.set(f"{STORE_URL}|catalog", catalog)
+    monkeypatch.setattr(woocommerce_logic, "get_wcapi", lambda *args: _API([]))
+
+    assert len(woocommerce_logic.search_products(STORE_URL, "ck", "cs", "vino", limit=8)) == 8
+    # La segunda consulta sale de la caché con el mismo límite
+    assert len(woocommerce_logic.search_products(STORE_URL, "ck", "cs", "vino", limit=8)) == 8
+    assert len(woocommerce_logic.search_products(STORE_URL, "ck", "cs", "vino")) == woocommerce_logic.SEARCH_TOP_K
+
+
+def test_exact_name_beats_popular_partial_matches():
+    catalog = [
+        {"id": 1, "name": "Destilado Mad Labs", "stock_status": "outofstock", "total_sales": 0},
+        {"id": 2, "name": "Destilado de agave", "stock_status": "instock", "total_sales": 5000},
+        {"id": 3, "name": "Destilado Mad Labs reserva", "stock_status": "instock", "total_sales": 10},
+    ]
+    ranked = woocommerce_logic.rank_products(catalog, "Destilado Mad Labs", 3)
+    assert [product["id"] for product in ranked] == [1, 3]
+
+
+def test_stopwords_do_not_match():
+    catalog = [
+        {"id": 1, "name": "Combo de batería de cocina", "stock_status": "instock", "total_sales": 50},
+        {"id": 2, "name": "Olla de presión 6L", "stock_status": "instock", "total_sales": 1},
+    ]
+    assert [product["id"] for product in woocommerce_logic.rank_products(catalog, "olla de presion", 3)] == [2]
+    assert woocommerce_logic.rank_products(catalog, "de", 3) == []
@@ -0,0 +1,21 @@
+import types
+
+import accounting
+import shadow
+
+
+def test_shadow_calls_are_accounted_under_the_tenant(monkeypatch, tmp_path):
+    monkeypatch.setattr(shadow, "SHADOW_DB_PATH", str(tmp_path / "shadow.db"))
+    monkeypatch.setattr(shadow, "_db", None)
+    usage = types.SimpleNamespace(prompt_tokens=120, completion_tokens=30, prompt_tokens_details=None)
+    response = types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="Hola"))], usage=usage)
+    fake_openai = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=lambda **params: response)))
+    monkeypatch.setattr(shadow, "openai", fake_openai)
+    monkeypatch.setattr(accounting, "_pending", {})
+
+    primary = {"model": "gpt-5-mini", "max_completion_tokens": 600, "reasoning_effort": "minimal",
+               "latency": 1.0, "usage": usage, "text": "Hola", "action": None}
+    shadow._run_variant("econi", {"name": "nano", "model": "gpt-5-nano"}, [{"role": "system", "content": "Prompt"}], primary)
+
+    counters = [values for (day, tenant, route), values in accounting._pending.items() if (tenant, route) == ("econi", "shadow:nano")]
+    assert counters and counters[0]["openai_calls"] == 1 and counters[0]["prompt_tokens"] == 120
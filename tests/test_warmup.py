@@ -0,0 +1,28 @@
+import time
+
+import warmup
+
+
+def test_failed_warm_up_still_reports_ready_and_starts_snapshots(monkeypatch):
+    def failing_warm_up(tenants):
+        warmup.state["started_at"] = time.time()
+        raise RuntimeError("tienda caída")
+
+    def failing_on_ready():
+        raise RuntimeError("feed caído")
+
+    calls = []
+    monkeypatch.setattr(warmup, "warm_up", failing_warm_up)
+    monkeypatch.setattr(warmup, "_snapshot_loop", lambda: calls.append("snapshot"))
+    monkeypatch.setattr(warmup, "SNAPSHOT_INTERVAL", 60)
+    monkeypatch.setattr(warmup.atexit, "register", lambda fn: None)
+    warmup.state.update(ready=False, finished_at=None)
+
+    warmup.start_warm_up({}, on_ready=failing_on_ready)
+    deadline = time.time() + 2
+    while not calls and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert warmup.state["ready"]
+    assert warmup.state["finished_at"] is not None
+    assert calls == ["snapshot"]
@@ -0,0 +1,67 @@
+import base64
+import hashlib
+import hmac
+import json
+
+import pytest
+
+import app as app_module
+import lifecycle
+import woocommerce_logic
+
+TENANT = "econi"
+SECRET = "secreto"
+URL = f"/woocommerce/{TENANT}/webhook"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(app_module.TENANTS[TENANT]["store_credentials"], "webhook_secret", SECRET)
+    return app_module.app.test_client()
+
+
+def _post(client, topic, payload, secret=SECRET):
+    body = json.dumps(payload).encode("utf-8")
+    signature = base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+    return client.post(URL, data=body, headers={"X-WC-Webhook-Topic": topic, "X-WC-Webhook-Signature": signature})
+
+
+def _stored(order_id):
+    store = woocommerce_logic.store_key(app_module.TENANTS[TENANT]["store_credentials"]["store_url"])
+    return woocommerce_logic.order_status_store.get(f"{store}|id:{order_id}")
+
+
+def test_ping_without_topic_is_accepted(client):
+    response = client.post(URL, data=b"webhook_id=1")
+    assert response.status_code == 200
+
+
+def test_bad_signature_is_rejected(client):
+    assert _post(client, "order.updated", {"id": 501}, secret="otro").status_code == 401
+    assert _stored(501) is None
+
+
+def test_non_object_body_is_rejected(client):
+    assert _post(client, "order.updated", [1, 2]).status_code == 400
+
+
+def test_out_of_order_update_does_not_overwrite_newer_status(client):
+    newer = {"id": 502, "status": "completed", "date_modified_gmt": "2026-01-02T10:00:00"}
+    older = {"id": 502, "status": "processing", "date_modified_gmt": "2026-01-01T10:00:00"}
+    assert _post(client, "order.updated", newer).get_json()["status"] == "applied"
+    assert _post(client, "order.updated", older).get_json()["status"] == "ignored"
+    assert _stored(502)["status"] == "completed"
+
+
+def test_deleted_order_is_removed(client):
+    _post(client, "order.created", {"id": 503, "status": "pending", "date_modified_gmt": "2026-01-01T10:00:00"})
+    assert _stored(503) is not None
+    assert _post(client, "order.deleted", {"id": 503}).status_code == 200
+    assert _stored(503) is None
+
+
+def test_webhooks_are_accepted_while_draining(client, monkeypatch):
+    monkeypatch.setitem(lifecycle.state, "draining", True)
+    response = _post(client, "order.updated", {"id": 504, "status": "processing", "date_modified_gmt": "2026-01-01T10:00:00"})
+    assert response.status_code == 200
+    assert client.post("/llm-integration/webhook", data=b"{}").status_code == 503
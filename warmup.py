@@ -0,0 +1,146 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import woocommerce_logic
+
+# Archivo donde se guarda el snapshot de las cachés de WooCommerce
+SNAPSHOT_PATH = os.getenv("WARMUP_SNAPSHOT_PATH", "cache_snapshot.json")
+# Cada cuántos segundos se escribe el snapshot (0 desactiva el guardado periódico)
+SNAPSHOT_INTERVAL = int(os.getenv("WARMUP_SNAPSHOT_INTERVAL", 300))
+# Directorio opcional con prompts <tenant>.txt que reemplazan a los definidos en app.py
+PROMPTS_DIR = os.getenv("TENANT_PROMPTS_DIR")
+# Variaciones máximas a precargar por tienda
+WARMUP_MAX_VARIATIONS = int(os.getenv("WARMUP_MAX_VARIATIONS", 50))
+
+# Estado del arranque, consultado por el endpoint de readiness
+state = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "restored": {},
+    "stores": {},
+}
+
+_snapshot_lock = threading.Lock()
+
+
+# Cargar los prompts de los tenants, con sobrescritura opcional desde disco
+def load_prompts(tenants):
+    for name, tenant in tenants.items():
+        if PROMPTS_DIR:
+            path = os.path.join(PROMPTS_DIR, f"{name}.txt")
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    tenant["prompt"] = f.read().strip()
+                logging.info(f"Prompt de {name} cargado desde {path}")
+
+
+# Escribir el snapshot de las cachés de forma atómica
+def save_snapshot(path=SNAPSHOT_PATH):
+    snapshot = {
+        "saved_at": time.time(),
+        "caches": {cache.name: cache.dump() for cache in woocommerce_logic.CACHES},
+    }
+    tmp_path = f"{path}.tmp"
+    with _snapshot_lock:
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.error(f"Error guardando el snapshot de caché: {e}")
+
+
+# Restaurar las cachés desde el último snapshot, si existe
+def load_snapshot(path=SNAPSHOT_PATH):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except Exception as e:
+        logging.error(f"Error leyendo el snapshot de caché: {e}")
+        return {}
+
+    caches = snapshot.get("caches", {})
+    return {
+        cache.name: cache.load(caches.get(cache.name, {}))
+        for cache in woocommerce_logic.CACHES
+    }
+
+
+def _snapshot_loop():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        save_snapshot()
+
+
+def _warm_store(store_credentials):
+    return woocommerce_logic.warm_store(
+        store_url=store_credentials['store_url'],
+        consumer_key=store_credentials['consumer_key'],
+        consumer_secret=store_credentials['consumer_secret'],
+        max_variations=WARMUP_MAX_VARIATIONS
+    )
+
+
+# Fase de arranque: prompts, snapshot y pools HTTP de cada tienda
+def warm_up(tenants):
+    state["started_at"] = time.time()
+    load_prompts(tenants)
+    state["restored"] = load_snapshot()
+
+    # Varias rutas pueden compartir la misma tienda; se calienta una sola vez
+    stores = {}
+    for tenant in tenants.values():
+        credentials = tenant["store_credentials"]
+        if not credentials.get('consumer_key') or not credentials.get('consumer_secret'):
+            continue
+        stores.setdefault(woocommerce_logic.store_key(credentials['store_url']), credentials)
+
+    with ThreadPoolExecutor(max_workers=max(len(stores), 1)) as executor:
+        futures = {store: executor.submit(_warm_store, credentials) for store, credentials in stores.items()}
+        for store, future in futures.items():
+            try:
+                state["stores"][store] = future.result()
+            except Exception as e:
+                logging.error(f"Error calentando la tienda {store}: {e}")
+                state["stores"][store] = {"error": str(e)}
+
+    state["finished_at"] = time.time()
+    state["ready"] = True
+    logging.info(f"Warm-up completado en {state['finished_at'] - state['started_at']:.1f}s")
+
+
+# No sobrescribir un snapshot válido si el proceso se detiene antes de restaurarlo
+def _save_on_exit():
+    if state["ready"]:
+        save_snapshot()
+
+
+# Iniciar el warm-up en segundo plano y programar el guardado del snapshot.
+# on_ready se ejecuta al terminar, para arrancar tareas que necesitan las cachés cargadas.
+def start_warm_up(tenants, on_ready=None):
+    def run():
+        try:
+            warm_up(tenants)
+        except Exception as e:
+            logging.error(f"Error en el warm-up: {e}")
+            state["finished_at"] = time.time()
+            state["ready"] = True
+        if on_ready is not None:
+            try:
+                on_ready()
+            except Exception as e:
+                logging.error(f"Error al terminar el warm-up: {e}")
+        if SNAPSHOT_INTERVAL > 0:
+            threading.Thread(target=_snapshot_loop, daemon=True).start()
+
+    # El snapshot también se escribe al apagar el proceso
+    atexit.register(_save_on_exit)
+    threading.Thread(target=run, daemon=True).start()
@@ -1,35 +1,290 @@
 from woocommerce import API
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+import requests
 import logging
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 
+from cache import TTLCache
+
+# Tamaño del pool de conexiones HTTP por tienda
+WOO_POOL_SIZE = int(os.getenv("WOO_POOL_SIZE", 10))
+# Límite de páginas (de 100 productos) al cargar el catálogo completo de una tienda
+CATALOG_MAX_PAGES = int(os.getenv("WOO_CATALOG_MAX_PAGES", 20))
+# Campos del producto que se guardan en el catálogo local
+CATALOG_FIELDS = "id,name,slug,sku,type,status,price,regular_price,sale_price,stock_status,stock_quantity,permalink,total_sales,date_modified_gmt"
+
+# Cachés compartidas por todas las tiendas; las claves empiezan por la URL de la tienda
+catalog_cache = TTLCache("catalog", ttl=6 * 3600, maxsize=50)
+search_cache = TTLCache("search", ttl=600, maxsize=2000)
+variations_cache = TTLCache("variations", ttl=1800, maxsize=5000)
+order_index = TTLCache("orders", ttl=120, maxsize=5000)
+# Estado de pedidos alimentado por los webhooks de WooCommerce (se mantiene al día solo)
+order_status_store = TTLCache("order_status", ttl=int(os.getenv("ORDER_STATUS_TTL", 7 * 24 * 3600)), maxsize=20000)
+# Ajustes generales de cada tienda (moneda y formato de precios), leídos en el warm-up
+settings_cache = TTLCache("settings", ttl=24 * 3600, maxsize=100)
+
+CACHES = [catalog_cache, search_cache, variations_cache, order_index, order_status_store, settings_cache]
+
+# Ajustes de settings/general que se usan para formatear precios
+STORE_SETTINGS = (
+    "woocommerce_currency",
+    "woocommerce_currency_pos",
+    "woocommerce_price_thousand_sep",
+    "woocommerce_price_decimal_sep",
+    "woocommerce_price_num_decimals",
+)
+
+# Campos del pedido que se conservan en el almacén de estados
+ORDER_FIELDS = ("id", "status", "total", "currency", "payment_method_title", "date_modified_gmt")
+ORDER_ADDRESS_FIELDS = ("first_name", "last_name", "address_1", "city", "state", "phone", "email")
+
+# Resultados que devuelve la búsqueda y candidatos pedidos a la tienda sin catálogo local
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", 3))
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", 20))
+# Fracción mínima de palabras de la búsqueda que debe contener el nombre del producto
+SEARCH_MIN_MATCH = float(os.getenv("SEARCH_MIN_MATCH", 0.5))
+_TOKEN_RE = re.compile(r"\w+")
+# Palabras que no identifican productos; se ignoran al comparar nombres
+_STOPWORDS = {
+    "de", "del", "la", "las", "el", "los", "un", "una", "unos", "unas", "y", "o", "en", "con",
+    "para", "por", "sin", "al", "que", "mi", "me", "quiero", "busco", "tienen", "hay",
+}
+
+# Hilos para las consultas concurrentes a WooCommerce (variaciones de varios productos)
+_executor = ThreadPoolExecutor(max_workers=WOO_POOL_SIZE)
+
+
+# Funciones llamadas tras cada petición a WooCommerce: (store_url, method, endpoint, latency, status_code)
+request_hooks = []
+
+
+# Cliente de WooCommerce que reutiliza conexiones HTTP (keep-alive) entre peticiones
+class PooledAPI(API):
+    def __init__(self, url, consumer_key, consumer_secret, **kwargs):
+        super().__init__(url, consumer_key, consumer_secret, **kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WOO_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    # Sustituye API.__request para enviar la petición por la sesión compartida
+    def _API__request(self, method, endpoint, data, params=None, **kwargs):
+        started_at = time.monotonic()
+        status_code = None
+        try:
+            response = self._send(method, endpoint, data, params, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            latency = time.monotonic() - started_at
+            for hook in request_hooks:
+                try:
+                    hook(self.url, method, endpoint, latency, status_code)
+                except Exception as e:
+                    logging.error(f"Error en el hook de peticiones a WooCommerce: {e}")
+
+    def _send(self, method, endpoint, data, params=None, **kwargs):
+        # Sin SSL la autenticación es OAuth; se delega en la implementación original
+        if not self.is_ssl:
+            return API._API__request(self, method, endpoint, data, params=params, **kwargs)
+
+        if params is None:
+            params = {}
+        url = self._API__get_url(endpoint)
+        auth = None
+        headers = {
+            "user-agent": f"{self.user_agent}",
+            "accept": "application/json"
+        }
+
+        if self.query_string_auth:
+            params.update({
+                "consumer_key": self.consumer_key,
+                "consumer_secret": self.consumer_secret
+            })
+        else:
+            auth = HTTPBasicAuth(self.consumer_key, self.consumer_secret)
+
+        if data is not None:
+            data = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            headers["content-type"] = "application/json;charset=utf-8"
+
+        return self.session.request(
+            method=method,
+            url=url,
+            verify=self.verify_ssl,
+            auth=auth,
+            params=params,
+            data=data,
+            timeout=self.timeout,
+            headers=headers,
+            **kwargs
+        )
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+# Normalizar la URL de la tienda para usarla como prefijo de las claves de caché
+def store_key(store_url):
+    return store_url.rstrip("/")
+
+
+# Obtener (o crear una sola vez) el cliente de WooCommerce de una tienda
+def get_wcapi(store_url, consumer_key, consumer_secret):
+    client_key = (store_key(store_url), consumer_key)
+    with _clients_lock:
+        wcapi = _clients.get(client_key)
+        if wcapi is None:
+            wcapi = PooledAPI(
+                url=store_url,
+                consumer_key=consumer_key,
+                consumer_secret=consumer_secret,
+                version="wc/v3"
+            )
+            _clients[client_key] = wcapi
+        return wcapi
+
+
+def _order_keys(order):
+    billing = order.get('billing', {}) or {}
+    keys = set()
+    if order.get('id'):
+        keys.add(f"id:{order['id']}")
+    if billing.get('phone'):
+        keys.add(f"phone:{billing['phone'].strip()}")
+    if billing.get('email'):
+        keys.add(f"email:{billing['email'].strip().lower()}")
+    return keys
+
+# Guardar un pedido en el índice local por ID, teléfono y correo
+def index_order(store_url, order, *lookup_keys):
+    store = store_key(store_url)
+    for key in _order_keys(order) | set(lookup_keys):
+        order_index.set(f"{store}|{key}", order)
+
+# Buscar un pedido localmente: primero el almacén de webhooks, después el índice de consultas
+def _lookup_order(store, key):
+    order = order_status_store.get(f"{store}|{key}")
+    if order is None:
+        order = order_index.get(f"{store}|{key}")
+    return order
+
+# Versión reducida del pedido con lo necesario para responder sobre su estado
+def _slim_order(order):
+    slim = {field: order[field] for field in ORDER_FIELDS if field in order}
+    for address in ('billing', 'shipping'):
+        data = order.get(address, {}) or {}
+        slim[address] = {field: data[field] for field in ORDER_ADDRESS_FIELDS if field in data}
+    slim['line_items'] = [
+        {"name": item.get('name'), "quantity": item.get('quantity'), "price": item.get('price'), "total": item.get('total')}
+        for item in order.get('line_items', [])
+    ]
+    return slim
+
+# Aplicar un evento de webhook de pedido (order.created, order.updated, order.deleted)
+def ingest_order_event(store_url, topic, order):
+    store = store_key(store_url)
+    if not isinstance(order, dict) or not order.get('id'):
+        return False
+
+    if topic == "order.deleted":
+        current = order_status_store.get(f"{store}|id:{order['id']}") or {}
+        for key in _order_keys(current) | {f"id:{order['id']}"}:
+            order_status_store.delete(f"{store}|{key}")
+            order_index.delete(f"{store}|{key}")
+        return True
+
+    # Los webhooks pueden llegar desordenados: no pisar un estado más reciente
+    current = order_status_store.get(f"{store}|id:{order['id']}")
+    if current is not None and (current.get('date_modified_gmt') or '') > (order.get('date_modified_gmt') or ''):
+        return False
+
+    slim = _slim_order(order)
+    for key in _order_keys(slim):
+        order_status_store.set(f"{store}|{key}", slim)
+        order_index.delete(f"{store}|{key}")
+    return True
+
+
+# La tienda rechazó el pedido (error 4xx): los datos no son válidos y reintentarlo no sirve
+class OrderRejected(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+# Crear un pedido; devuelve el pedido creado o None si falló por red o error del servidor.
+# Lanza OrderRejected si la tienda lo rechaza (salvo 408 y 429, que son temporales).
 def create_order(store_url, consumer_key, consumer_secret, order_data):
-    wcapi = API(
-        url=store_url,
-        consumer_key=consumer_key,
-        consumer_secret=consumer_secret,
-        version="wc/v3"
-    )
+    wcapi = get_wcapi(store_url, consumer_key, consumer_secret)
     try:
         response = wcapi.post("orders", data=order_data)
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            raise OrderRejected(response.status_code, response.text[:500])
+        response.raise_for_status()
         return response.json()
+    except OrderRejected:
+        raise
     except Exception as e:
         logging.error(f"Error creating order: {e}")
         return None
 
+# Buscar entre los pedidos creados desde after (timestamp) uno con la meta key=value.
+# Devuelve None si no existe; los errores se propagan para no duplicar pedidos a ciegas.
+def find_order_by_meta(store_url, consumer_key, consumer_secret, key, value, after):
+    wcapi = get_wcapi(store_url, consumer_key, consumer_secret)
+    # Margen por la diferencia de reloj con la tienda
+    after_iso = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(after - 3600))
+    page = 1
+    while True:
+        response = wcapi.get("orders", params={
+            "after": after_iso,
+            "dates_are_gmt": True,
+            "per_page": 100,
+            "page": page,
+            "_fields": "id,meta_data",
+        })
+        response.raise_for_status()
+        orders = response.json()
+        for order in orders:
+            if any(meta.get('key') == key and str(meta.get('value')) == str(value) for meta in order.get('meta_data') or []):
+                return order
+        if len(orders) < 100:
+            return None
+        page += 1
+
 def get_order(store_url, consumer_key, consumer_secret, order_id=None, phone=None, email=None):
-    wcapi = API(
-        url=store_url,
-        consumer_key=consumer_key,
-        consumer_secret=consumer_secret,
-        version="wc/v3"
-    )
-    
+    wcapi = get_wcapi(store_url, consumer_key, consumer_secret)
+    store = store_key(store_url)
+
     try:
         if order_id:
+            # Consultar primero los pedidos conocidos localmente
+            cached = _lookup_order(store, f"id:{order_id}")
+            if cached is not None:
+                return cached
             # Consulta específica por ID de pedido
             response = wcapi.get(f"orders/{order_id}")
             response.raise_for_status()
-            return response.json()
+            order = response.json()
+            index_order(store_url, order, f"id:{order_id}")
+            return order
         elif phone or email:
+            lookup_key = f"phone:{phone}" if phone else f"email:{email.lower()}"
+            cached = _lookup_order(store, lookup_key)
+            if cached is not None:
+                return cached
+
             # Utilizar el parámetro 'search' para buscar por teléfono o correo electrónico
             search_query = ""
             if phone:
@@ -37,20 +292,20 @@ def get_order(store_url, consumer_key, consumer_secret, order_id=None, phone=Non
             if email:
                 search_query += email
             search_query = search_query.strip()
-            
+
             if not search_query:
                 logging.error("Se debe proporcionar al menos un parámetro de búsqueda (order_id, phone o email).")
                 return None
-            
+
             params = {
                 'search': search_query,
                 'per_page': 100  # Ajusta según sea necesario
             }
-            
+
             response = wcapi.get("orders", params=params)
             response.raise_for_status()
             orders = response.json()
-            
+
             if orders:
                 # Filtrar los pedidos para encontrar coincidencias exactas
                 for order in orders:
@@ -64,8 +319,10 @@ def get_order(store_url, consumer_key, consumer_secret, order_id=None, phone=Non
                         if order_email == email.lower():
                             match = True
                     if match:
+                        index_order(store_url, order, lookup_key)
                         return order  # Retornar el primer pedido que coincida exactamente
                 # Si no se encuentra una coincidencia exacta, retornar el primero de la búsqueda
+                index_order(store_url, orders[0], lookup_key)
                 return orders[0]
             else:
                 return None
@@ -75,18 +332,220 @@ def get_order(store_url, consumer_key, consumer_secret, order_id=None, phone=Non
     except Exception as e:
         logging.error(f"Error obteniendo el pedido: {e}")
         return None
-    
-def search_products(store_url, consumer_key, consumer_secret, search_query):
-    wcapi = API(
-        url=store_url,
-        consumer_key=consumer_key,
-        consumer_secret=consumer_secret,
-        version="wc/v3"
-    )
+
+# Normalizar texto para comparar nombres: minúsculas y sin tildes
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+# Palabras de la búsqueda que identifican productos: sin palabras vacías ni tokens cortos
+# (los números se conservan por tallas y medidas)
+def _query_tokens(query):
+    return [token for token in _TOKEN_RE.findall(query) if token not in _STOPWORDS and (len(token) > 2 or token.isdigit())]
+
+# Puntuación de un producto para la búsqueda: (coincidencia de nombre, desempate por stock y popularidad).
+# La coincidencia decide el orden; 0 si el producto no coincide lo suficiente.
+def _score_product(product, query, query_tokens):
+    name = _normalize(product.get('name'))
+    sku = _normalize(product.get('sku'))
+    name_tokens = set(_TOKEN_RE.findall(name))
+    if query_tokens and name == query:
+        match_score = 4.0
+    elif query_tokens and query in name:
+        match_score = 3.0
+    elif query and query == sku:
+        match_score = 3.0
+    elif query_tokens:
+        matched = sum(1 for token in query_tokens if token in name_tokens or (len(token) > 3 and token in name))
+        fraction = matched / len(query_tokens)
+        match_score = 2.0 * fraction if fraction >= SEARCH_MIN_MATCH else 0.0
+    else:
+        match_score = 0.0
+    if match_score == 0:
+        return (0.0, 0.0)
+
+    stock_status = product.get('stock_status')
+    stock_score = 1.0 if stock_status == 'instock' else (0.5 if stock_status == 'onbackorder' else -1.0)
+    popularity_score = 0.2 * math.log1p(product.get('total_sales') or 0)
+    return (match_score, stock_score + popularity_score)
+
+# Ordenar productos por relevancia y devolver los k mejores
+def rank_products(products, search_query, limit=SEARCH_TOP_K):
+    query = _normalize(search_query).strip()
+    query_tokens = _query_tokens(query)
+    scored = [(_score_product(product, query, query_tokens), product) for product in products]
+    scored = [(score, product) for score, product in scored if score[0] > 0]
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [product for _, product in scored[:limit]]
+
+# Buscar productos; se guardan en caché hasta SEARCH_CANDIDATES resultados y se devuelven los primeros limit
+def search_products(store_url, consumer_key, consumer_secret, search_query, limit=SEARCH_TOP_K):
+    cache_key = f"{store_key(store_url)}|{search_query.strip().lower()}"
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached[:limit]
+
+    # Con el catálogo local cargado la búsqueda no necesita llamar a la tienda, salvo que no
+    # encuentre nada: la búsqueda de WooCommerce también mira las descripciones y el catálogo
+    # local puede estar truncado por CATALOG_MAX_PAGES
+    catalog = get_catalog(store_url)
+    if catalog:
+        products = rank_products(catalog, search_query, SEARCH_CANDIDATES)
+        if products:
+            search_cache.set(cache_key, products)
+            return products[:limit]
+
+    wcapi = get_wcapi(store_url, consumer_key, consumer_secret)
     try:
-        response = wcapi.get("products", params={"search": search_query, "per_page": 1})
+        # Una sola consulta con varios candidatos, ordenados después localmente
+        response = wcapi.get("products", params={
+            "search": search_query,
+            "status": "publish",
+            "per_page": SEARCH_CANDIDATES,
+            "_fields": CATALOG_FIELDS,
+        })
         response.raise_for_status()  # Asegura que se manejen errores HTTP
-        return response.json()
+        candidates = response.json()
+        # WooCommerce ya filtró por la búsqueda: primero los que coinciden por nombre o SKU
+        # y después el resto de sus resultados
+        ranked = rank_products(candidates, search_query, len(candidates))
+        ranked_ids = {product.get('id') for product in ranked}
+        products = ranked + [product for product in candidates if product.get('id') not in ranked_ids]
+        search_cache.set(cache_key, products)
+        return products[:limit]
     except Exception as e:
         logging.error(f"Error searching products: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def get_variations(store_url, consumer_key, consumer_secret, product_id):
+    cache_key = f"{store_key(store_url)}|{product_id}"
+    cached = variations_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    wcapi = get_wcapi(store_url, consumer_key, consumer_secret)
+    response = wcapi.get(f"products/{product_id}/variations", params={"per_page": 100})
+    response.raise_for_status()
+    variations = response.json()
+    variations_cache.set(cache_key, variations)
+    return variations
+
+# Variaciones de varios productos en paralelo; devuelve {product_id: variaciones o None}
+def get_variations_many(store_url, consumer_key, consumer_secret, product_ids):
+    # Cada tarea hereda el contexto de la petición (p. ej. el tenant para la contabilidad)
+    futures = {
+        product_id: _executor.submit(
+            contextvars.copy_context().run, get_variations, store_url, consumer_key, consumer_secret, product_id
+        )
+        for product_id in product_ids
+    }
+    results = {}
+    for product_id, future in futures.items():
+        try:
+            results[product_id] = future.result()
+        except Exception as e:
+            logging.error(f"Error obteniendo variaciones para el producto {product_id}: {e}")
+            results[product_id] = None
+    return results
+
+# Descargar el catálogo publicado de la tienda y guardarlo en la caché local
+def load_catalog(store_url, consumer_key, consumer_secret):
+    wcapi = get_wcapi(store_url, consumer_key, consumer_secret)
+    products = []
+    for page in range(1, CATALOG_MAX_PAGES + 1):
+        response = wcapi.get("products", params={
+            "status": "publish",
+            "per_page": 100,
+            "page": page,
+            "_fields": CATALOG_FIELDS,
+        })
+        response.raise_for_status()
+        batch = response.json()
+        products.extend(batch)
+        if len(batch) < 100:
+            break
+    catalog_cache.set(f"{store_key(store_url)}|catalog", products)
+    return products
+
+def get_catalog(store_url):
+    return catalog_cache.get(f"{store_key(store_url)}|catalog")
+
+# Productos modificados desde `since` (ISO 8601, GMT), incluidos los despublicados
+def fetch_catalog_changes(store_url, consumer_key, consumer_secret, since):
+    wcapi = get_wcapi(store_url, consumer_key, consumer_secret)
+    changes = []
+    for page in range(1, CATALOG_MAX_PAGES + 1):
+        response = wcapi.get("products", params={
+            "status": "any",
+            "modified_after": since,
+            "dates_are_gmt": "true",
+            "per_page": 100,
+            "page": page,
+            "_fields": CATALOG_FIELDS,
+        })
+        response.raise_for_status()
+        batch = response.json()
+        changes.extend(batch)
+        if len(batch) < 100:
+            break
+    return changes
+
+# Aplicar cambios de precio y stock al catálogo local e invalidar las búsquedas cacheadas
+def apply_catalog_changes(store_url, changes):
+    store = store_key(store_url)
+    catalog = {product['id']: product for product in get_catalog(store_url) or []}
+    for product in changes:
+        if product.get('status', 'publish') == 'publish':
+            catalog[product['id']] = product
+        else:
+            catalog.pop(product['id'], None)
+        variations_cache.delete(f"{store}|{product['id']}")
+    catalog_cache.set(f"{store}|catalog", list(catalog.values()))
+    if changes:
+        search_cache.delete_prefix(f"{store}|")
+    return len(changes)
+
+# Leer de la tienda los ajustes de moneda y formato de precios y guardarlos en caché
+def load_store_settings(store_url, consumer_key, consumer_secret):
+    wcapi = get_wcapi(store_url, consumer_key, consumer_secret)
+    try:
+        response = wcapi.get("settings/general")
+        response.raise_for_status()
+        settings = {item['id']: item.get('value') for item in response.json() if item.get('id') in STORE_SETTINGS}
+    except Exception as e:
+        # Las claves de solo lectura de productos no pueden leer los ajustes; no reintentar en una hora
+        logging.error(f"Error leyendo los ajustes de la tienda {store_url}: {e}")
+        settings_cache.set(f"{store_key(store_url)}|settings", {}, ttl=3600)
+        return {}
+    settings_cache.set(f"{store_key(store_url)}|settings", settings)
+    return settings
+
+def get_store_settings(store_url):
+    return settings_cache.get(f"{store_key(store_url)}|settings")
+
+# Abrir el pool de conexiones de la tienda y precargar catálogo y variaciones
+def warm_store(store_url, consumer_key, consumer_secret, max_variations=50):
+    wcapi = get_wcapi(store_url, consumer_key, consumer_secret)
+    if get_store_settings(store_url) is None:
+        load_store_settings(store_url, consumer_key, consumer_secret)
+    catalog = get_catalog(store_url)
+    if catalog is None:
+        catalog = load_catalog(store_url, consumer_key, consumer_secret)
+    else:
+        # El catálogo vino del snapshot; basta una petición ligera para abrir la conexión
+        response = wcapi.get("products", params={"per_page": 1, "_fields": "id"})
+        response.raise_for_status()
+
+    store = store_key(store_url)
+    warmed = 0
+    for product in catalog:
+        if warmed >= max_variations:
+            break
+        if product.get('type') != 'variable' or variations_cache.get(f"{store}|{product['id']}") is not None:
+            continue
+        try:
+            get_variations(store_url, consumer_key, consumer_secret, product['id'])
+            warmed += 1
+        except Exception as e:
+            logging.error(f"Error precargando variaciones del producto {product['id']}: {e}")
+    return {"products": len(catalog), "variations": warmed}